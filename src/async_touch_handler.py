@@ -0,0 +1,217 @@
+import asyncio
+import socket
+
+from control_messages import ACTION_DOWN, ACTION_UP, TOUCH, ControlMessageEncoder
+from instrumentation import count, span
+
+
+class AsyncTouchHandler:
+    """
+    Asyncio implementation of the scrcpy control channel.
+
+    Taps and strokes are encoded when added and buffered until flush(), which hands them to the sender
+    task as one batch and returns a future that completes once the batch has been written. The batch
+    queue is bounded, so flush() waits when the sender falls behind. The sender paces bursts of
+    burst_size steps to taps_per_second for taps and moves_per_second for the steps of a stroke.
+    A send error fails the pending batches and is raised by later calls. close() cancels the sender and
+    every batch not yet written, including the one being sent.
+
+    Example:
+    >>> async with AsyncTouchHandler(control_socket, 1080, 2400) as touch_handler:
+    >>>   await touch_handler.add_touch(100, 100)
+    >>>   await (await touch_handler.flush())
+    """
+
+    def __init__(
+        self,
+        control_socket: socket.socket,
+        width: int,
+        height: int,
+        taps_per_second=20.0,
+        moves_per_second=60.0,
+        burst_size=1,
+        max_pending_batches=16,
+    ):
+        """
+        control_socket: connected scrcpy control socket. A duplicate is used, the socket itself is left open.
+            The duplicate shares the socket's O_NONBLOCK flag, so the socket is non-blocking while the handler
+            is open and must not be used directly until close(), which restores its mode.
+        width, height: device screen size in pixels, touch coordinates are relative to it
+        """
+        self.control_socket = control_socket
+        self.encoder = ControlMessageEncoder(width, height)
+
+        self.taps_per_second = taps_per_second
+        self.moves_per_second = moves_per_second
+        self.burst_size = burst_size
+        self.max_pending_batches = max_pending_batches
+
+        self.pending_steps: list[tuple[bytes | memoryview, float]] = []  # (encoded messages, seconds to wait after them)
+        self.last_batch: asyncio.Future | None = None
+        self.error: BaseException | None = None
+
+    async def open(self):
+        _, self.writer = await asyncio.open_connection(sock=self.control_socket.dup())
+        self.batch_queue: asyncio.Queue[tuple[list[tuple[bytes | memoryview, float]], asyncio.Future]] = asyncio.Queue(
+            self.max_pending_batches
+        )
+        self.sender_task = asyncio.create_task(self.__run_sender())
+
+    async def close(self):
+        self.sender_task.cancel()
+        try:
+            await self.sender_task
+        except asyncio.CancelledError:
+            pass
+        self.__fail_pending(None)
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except OSError:
+            pass
+        # asyncio made the shared descriptor non-blocking, re-apply the mode the socket object expects
+        self.control_socket.settimeout(self.control_socket.gettimeout())
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, type, value, traceback):
+        try:
+            if type is None:
+                await self.drain()
+        finally:
+            await self.close()
+
+    async def __run_sender(self):
+        loop = asyncio.get_running_loop()
+        next_burst_time = loop.time()
+        while True:
+            steps, done = await self.batch_queue.get()
+            sent_bytes = sent_steps = 0
+            try:
+                with span("send_batch", steps=len(steps)):
+                    for start in range(0, len(steps), self.burst_size):
+                        burst = steps[start : start + self.burst_size]
+                        delay = next_burst_time - loop.time()
+                        if delay > 0:
+                            await asyncio.sleep(delay)
+                        data = b"".join(message for message, _ in burst)
+                        self.writer.write(data)
+                        await self.writer.drain()
+                        sent_bytes += len(data)
+                        sent_steps += len(burst)
+                        next_burst_time = max(next_burst_time, loop.time()) + sum(duration for _, duration in burst)
+            except (OSError, ConnectionError) as e:
+                self.error = e
+                if not done.done():
+                    done.set_exception(e)
+                self.__fail_pending(e)
+                return
+            except asyncio.CancelledError:
+                # close() cancelled the batch being sent, only the queued ones are left to __fail_pending
+                done.cancel()
+                raise
+            finally:
+                count("socket_bytes", sent_bytes)
+                count("steps_sent", sent_steps)
+                self.batch_queue.task_done()
+
+            if not done.done():
+                done.set_result(None)
+
+    def __fail_pending(self, error: BaseException | None):
+        """Fail the batches still queued with error, or cancel them if error is None."""
+        while not self.batch_queue.empty():
+            _, done = self.batch_queue.get_nowait()
+            if not done.done():
+                if error is None:
+                    done.cancel()
+                else:
+                    done.set_exception(error)
+            self.batch_queue.task_done()
+
+    def __check(self):
+        if self.error is not None:
+            raise ConnectionError("Control channel failed") from self.error
+
+    def __queue_gestures(self, encoded: bytes, ends: list[int]):
+        """Split encoded gestures into paced steps: the down and each move take a move step, the last move and the up
+        together take a tap step. A tap (down and up) is a single tap step."""
+        view = memoryview(encoded)
+        move_step = 1.0 / self.moves_per_second
+        tap_step = 1.0 / self.taps_per_second
+        size = TOUCH.size
+
+        start = 0
+        for end in ends:
+            last = end - 2 * size
+            for offset in range(start, last, size):
+                self.pending_steps.append((view[offset : offset + size], move_step))
+            self.pending_steps.append((view[last:end], tap_step))
+            start = end
+
+    async def add_touch(self, x, y):
+        """
+        Queue a touch event. Full bursts are flushed automatically.
+        """
+        await self.add_strokes([[(x, y)]])
+
+    async def add_stroke(self, points: list[tuple[int, int]]):
+        """
+        Queue a drag through the given points: down on the first one, a move to each following one, up on the last.
+        A single point is a tap.
+        """
+        await self.add_strokes([points])
+
+    async def add_strokes(self, gestures: list[list[tuple[int, int]]]):
+        """
+        Queue several strokes at once, encoded in a single call.
+        """
+        encoded, ends = self.encoder.batch(gestures)
+        count("gestures", len(gestures))
+        self.__queue_gestures(bytes(encoded), ends)  # one copy out of the encoder ring
+        if len(self.pending_steps) >= self.burst_size:
+            await self.flush()
+
+    async def add_key(self, keycode: int):
+        """
+        Queue a key press (down and up), keycode being an Android AKEYCODE_* value.
+        """
+        message = bytes(self.encoder.key(ACTION_DOWN, keycode)) + bytes(self.encoder.key(ACTION_UP, keycode))
+        count("keys")
+        self.pending_steps.append((message, 1.0 / self.taps_per_second))
+        if len(self.pending_steps) >= self.burst_size:
+            await self.flush()
+
+    async def flush(self) -> asyncio.Future:
+        """
+        Hand the buffered taps and strokes to the sender as one batch.
+        Returns a future that completes when the batch has been written.
+        """
+        self.__check()
+        done = asyncio.get_running_loop().create_future()
+        # batches flushed automatically are not awaited, the error is raised by the next call instead
+        done.add_done_callback(lambda future: future.cancelled() or future.exception())
+        if not self.pending_steps:
+            done.set_result(None)
+            return done
+
+        steps, self.pending_steps = self.pending_steps, []
+        self.last_batch = done
+        await self.batch_queue.put((steps, done))
+        return done
+
+    async def busy(self) -> bool:
+        """
+        Whether flushed batches are still being sent. Batches are sent in order, so this is the last one.
+        """
+        return self.last_batch is not None and not self.last_batch.done()
+
+    async def drain(self):
+        """
+        Flush and wait until every tap and stroke added so far has been written.
+        """
+        await self.flush()
+        await self.batch_queue.join()
+        self.__check()
@@ -0,0 +1,70 @@
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from glob import glob
+from pathlib import Path
+
+from solver import Solver
+
+solver: Solver | None = None
+
+
+def init_worker(cache_size: int | None):
+    # one solver per process, so the line cache is shared by every puzzle the process solves
+    global solver
+    solver = Solver(cache_size=cache_size)
+
+
+def solve_file(problem_path: str) -> dict:
+    start = time.perf_counter()
+    try:
+        solution = solver.solve(Path(problem_path))
+    except Exception as e:
+        return {"path": problem_path, "error": str(e)}
+
+    return {
+        "path": problem_path,
+        "rows": solution.shape[0],
+        "cols": solution.shape[1],
+        "solution": ["".join("#" if cell else "." for cell in row) for row in solution],
+        "seconds": round(time.perf_counter() - start, 6),
+    }
+
+
+def find_problems(pattern: str) -> list[str]:
+    """A directory is searched recursively for .nin files, anything else is treated as a glob."""
+    path = Path(pattern)
+    if path.is_dir():
+        return sorted(str(p) for p in path.rglob("*.nin"))
+    return sorted(glob(pattern, recursive=True))
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Solve a directory of .nin puzzles, one JSON line per puzzle.")
+    parser.add_argument("problems", help="directory of .nin files or a glob pattern")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--cache-size", type=int, default=1 << 16, help="line cache size per worker")
+    args = parser.parse_args(argv)
+
+    problem_paths = find_problems(args.problems)
+    if not problem_paths:
+        print(f"No puzzles found: {args.problems}", file=sys.stderr)
+        sys.exit(1)
+
+    failed = 0
+    with ProcessPoolExecutor(
+        max_workers=args.workers, initializer=init_worker, initargs=(args.cache_size,)
+    ) as executor:
+        futures = [executor.submit(solve_file, path) for path in problem_paths]
+        for future in as_completed(futures):
+            result = future.result()
+            failed += "error" in result
+            print(json.dumps(result), flush=True)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Micro-benchmark of ControlMessageEncoder against the bytearray concatenation encoder it replaced.
+
+Run from src/: python bench_encoder.py
+"""
+
+import timeit
+
+from control_messages import ControlMessageEncoder
+
+WIDTH, HEIGHT = 1080, 2400
+
+
+def legacy_touch_action_down(x, y):
+    control_message = bytearray()
+    control_message.append(0x02)  # SC_CONTROL_MSG_TYPE_INJECT_TOUCH_EVENT
+    control_message.append(0x00)  # AKEY_EVENT_ACTION_DOWN
+    control_message += bytearray((0xFF, 0xFF, 0xFF, 0xFF, 0xFF, 0xFF, 0xFF, 0xFE))  # pointer id
+    control_message += bytearray(x.to_bytes(4, byteorder="big"))  # x
+    control_message += bytearray(y.to_bytes(4, byteorder="big"))  # y
+    control_message += bytearray(WIDTH.to_bytes(2, byteorder="big"))  # width
+    control_message += bytearray(HEIGHT.to_bytes(2, byteorder="big"))  # height
+    control_message += bytearray((0xFF, 0xFF))  # pressure
+    control_message += bytearray((0x00, 0x00, 0x00, 0x01))  # AMOTION_EVENT_BUTTON_PRIMARY (action button)
+    control_message += bytearray((0x00, 0x00, 0x00, 0x01))  # AMOTION_EVENT_BUTTON_PRIMARY (buttons)
+    return control_message
+
+
+def legacy_touch_action_move(x, y):
+    control_message = bytearray()
+    control_message.append(0x02)  # SC_CONTROL_MSG_TYPE_INJECT_TOUCH_EVENT
+    control_message.append(0x02)  # AMOTION_EVENT_ACTION_MOVE
+    control_message += bytearray((0xFF, 0xFF, 0xFF, 0xFF, 0xFF, 0xFF, 0xFF, 0xFE))  # pointer id
+    control_message += bytearray(x.to_bytes(4, byteorder="big"))  # x
+    control_message += bytearray(y.to_bytes(4, byteorder="big"))  # y
+    control_message += bytearray(WIDTH.to_bytes(2, byteorder="big"))  # width
+    control_message += bytearray(HEIGHT.to_bytes(2, byteorder="big"))  # height
+    control_message += bytearray((0xFF, 0xFF))  # pressure
+    control_message += bytearray((0x00, 0x00, 0x00, 0x00))  # no action button
+    control_message += bytearray((0x00, 0x00, 0x00, 0x01))  # AMOTION_EVENT_BUTTON_PRIMARY (buttons)
+    return control_message
+
+
+def legacy_touch_action_up(x, y):
+    control_message = bytearray()
+    control_message.append(0x02)  # SC_CONTROL_MSG_TYPE_INJECT_TOUCH_EVENT
+    control_message.append(0x01)  # AKEY_EVENT_ACTION_UP
+    control_message += bytearray((0xFF, 0xFF, 0xFF, 0xFF, 0xFF, 0xFF, 0xFF, 0xFE))  # pointer id
+    control_message += bytearray(x.to_bytes(4, byteorder="big"))  # x
+    control_message += bytearray(y.to_bytes(4, byteorder="big"))  # y
+    control_message += bytearray(WIDTH.to_bytes(2, byteorder="big"))  # width
+    control_message += bytearray(HEIGHT.to_bytes(2, byteorder="big"))  # height
+    control_message += bytearray((0x00, 0x00))  # pressure
+    control_message += bytearray((0x00, 0x00, 0x00, 0x01))  # AMOTION_EVENT_BUTTON_PRIMARY
+    control_message += bytearray((0x00, 0x00, 0x00, 0x00))  # none
+    return control_message
+
+
+def legacy_gesture(points):
+    (x, y), *rest = points
+    message = legacy_touch_action_down(x, y)
+    for x, y in rest:
+        message += legacy_touch_action_move(x, y)
+    return message + legacy_touch_action_up(x, y)
+
+
+def main():
+    encoder = ControlMessageEncoder(WIDTH, HEIGHT)
+
+    tap = [(540, 1200)]
+    stroke = [(100 + 32 * i, 1200) for i in range(30)]
+    board = [[(100 + 32 * x, 900 + 32 * y) for x in range(10)] for y in range(30)] * 2
+
+    # same bytes as before
+    for gesture in (tap, stroke):
+        assert bytes(encoder.gesture(gesture)) == bytes(legacy_gesture(gesture))
+
+    cases = [
+        ("tap", lambda: legacy_gesture(tap), lambda: encoder.gesture(tap)),
+        ("30-cell stroke", lambda: legacy_gesture(stroke), lambda: encoder.gesture(stroke)),
+        (
+            "60-stroke batch",
+            lambda: b"".join(legacy_gesture(gesture) for gesture in board),
+            lambda: encoder.batch(board),
+        ),
+    ]
+    for name, legacy, current in cases:
+        number = 2000
+        legacy_time = min(timeit.repeat(legacy, number=number, repeat=5)) / number
+        current_time = min(timeit.repeat(current, number=number, repeat=5)) / number
+        print(
+            f"{name:>16}: legacy {legacy_time * 1e6:9.2f} us, "
+            f"struct {current_time * 1e6:9.2f} us, {legacy_time / current_time:5.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""Offline benchmark of the reader, solver and planner stages over a corpus of recorded boards.
+
+A corpus is a directory of ground truth .nin files, searched recursively. Next to each puzzle there may be
+    <name>.png       a screenshot of the board, which enables the reader stages and the clue accuracy
+    <name>.solution  the expected solution, one line per row, # for filled cells and . for empty ones.
+                     Puzzles with several solutions may be solved differently, which is reported but not an error.
+
+Boards are recorded with `python program.py read --save-screenshot ../corpus/<name>.png`, which saves the capture
+and the clues read from it; check the .nin by hand, it is the ground truth. Boards named synthetic_* are rendered
+from the digit templates, so reading them only checks the templates against themselves: they are timed, but
+their clue accuracy is reported apart, under synthetic_accuracy, and left out of accuracy.
+
+Run from src/: python benchmark.py ../corpus -n 20 -o results.json
+Compare against an earlier run with --baseline, which fails if a stage's p50 got slower than --tolerance.
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Callable
+
+import cv2
+import numpy as np
+
+from batch import find_problems
+from board_reader import BoardReader
+from geometry import BoardGeometry
+from planner import build_schedule, row_runs
+from solver import Solver
+
+STAGES = ("detect_board_size", "split_rows", "split_cols", "solve", "schedule")
+
+
+def timed(samples: dict[str, list[float]], stage: str, function: Callable, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    samples.setdefault(stage, []).append(time.perf_counter() - start)
+    return result
+
+
+def read_solution(path: Path) -> np.ndarray:
+    with open(path, "r") as f:
+        return np.array([[char == "#" for char in line.strip()] for line in f if line.strip()], dtype=bool)
+
+
+def count_correct(read: list[list[int]], truth: list[list[int]]) -> int:
+    """Lines whose clue was read exactly, zero clues being the same as no clue."""
+    if len(read) != len(truth):
+        return 0
+    return sum([n for n in a if n > 0] == [n for n in b if n > 0] for a, b in zip(read, truth))
+
+
+def satisfies(solution: np.ndarray, rows: list[list[int]], cols: list[list[int]]) -> bool:
+    """Whether a solution has exactly the given clues."""
+
+    def clues(lines: np.ndarray) -> list[list[int]]:
+        return [[len(run) for run in row_runs(line[np.newaxis])] for line in lines]
+
+    return clues(solution) == [[n for n in row if n > 0] for row in rows] and clues(solution.T) == [
+        [n for n in col if n > 0] for col in cols
+    ]
+
+
+def benchmark_case(problem_path: Path, reader: BoardReader, iterations: int, warm_cache: bool) -> dict:
+    rows, cols = Solver.read_problem(problem_path)
+    screenshot_path = problem_path.with_suffix(".png")
+    solution_path = problem_path.with_suffix(".solution")
+    samples: dict[str, list[float]] = {}
+    result: dict = {
+        "path": str(problem_path),
+        "rows": len(rows),
+        "cols": len(cols),
+        "synthetic": problem_path.name.startswith("synthetic_"),
+    }
+
+    geometry = None
+    if screenshot_path.exists():
+        reader.IMAGE = cv2.imdecode(np.fromfile(screenshot_path, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if reader.IMAGE is None:
+            raise Exception(f"Failed to load {screenshot_path}")
+
+        for _ in range(iterations):
+            geometry = timed(samples, "detect_board_size", reader.detect_board_size)
+            LEFT = reader.IMAGE[geometry.top : geometry.bottom, 0 : geometry.left]
+            TOP = reader.IMAGE[0 : geometry.top, geometry.left : geometry.right]
+            row_candidates = timed(samples, "split_rows", reader.split_rows, LEFT, geometry)
+            col_candidates = timed(samples, "split_cols", reader.split_cols, TOP, geometry)
+
+        read_rows, read_cols = reader.most_likely(row_candidates), reader.most_likely(col_candidates)
+        result["lines"] = len(rows) + len(cols)
+        result["lines_correct"] = count_correct(read_rows, rows) + count_correct(read_cols, cols)
+        try:
+            resolved = Solver().resolve_clues(row_candidates, col_candidates)
+            result["resolved_correct"] = (
+                count_correct(resolved[0], rows) + count_correct(resolved[1], cols) == result["lines"]
+            )
+        except Exception as e:  # AmbiguousClues, or no reading fits
+            result["resolved_correct"] = False
+            result["resolve_error"] = str(e)
+
+    if geometry is None:
+        # no screenshot: plan on a nominal 32 pixel grid
+        width, height = 32 * len(cols), 32 * len(rows)
+        geometry = BoardGeometry(0, 0, width, height, len(rows), len(cols), screen_width=width, screen_height=height)
+
+    solver = Solver()
+    for _ in range(iterations):
+        if not warm_cache:
+            solver.cache_clear()
+        solution = timed(samples, "solve", solver.solve_clues, rows, cols)
+        schedule = timed(samples, "schedule", build_schedule, solution, geometry.cell_to_coordinates)
+
+    result["gestures"] = len(schedule.gestures)
+    result["solution_valid"] = satisfies(solution, rows, cols)
+    if solution_path.exists():
+        result["solution_matches"] = bool(np.array_equal(solution, read_solution(solution_path)))
+
+    result["samples"] = samples
+    return result
+
+
+def accuracy(read_cases: list[dict]) -> dict:
+    """Clue accuracy over the cases with a screenshot."""
+    result = {
+        "boards": len(read_cases),
+        "lines": sum(case["lines"] for case in read_cases),
+        "lines_correct": sum(case["lines_correct"] for case in read_cases),
+        "boards_resolved": sum(case["resolved_correct"] for case in read_cases),
+    }
+    result["line_accuracy"] = round(result["lines_correct"] / result["lines"], 4) if result["lines"] else None
+    return result
+
+
+def summarize(samples: list[float]) -> dict:
+    milliseconds = np.array(samples) * 1000.0
+    return {
+        "samples": len(samples),
+        "p50_ms": round(float(np.percentile(milliseconds, 50)), 3),
+        "p95_ms": round(float(np.percentile(milliseconds, 95)), 3),
+        "mean_ms": round(float(milliseconds.mean()), 3),
+    }
+
+
+def version() -> str | None:
+    try:
+        return subprocess.check_output(
+            ["git", "describe", "--always", "--dirty"], cwd=Path(__file__).parent, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Stages whose p50 is more than `tolerance` (a fraction) slower than in the baseline."""
+    regressions = []
+    for stage, stats in report["stages"].items():
+        before = baseline.get("stages", {}).get(stage)
+        if before and stats["p50_ms"] > before["p50_ms"] * (1.0 + tolerance):
+            regressions.append(f"{stage}: p50 {before['p50_ms']} ms -> {stats['p50_ms']} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the reader, solver and planner over a corpus.")
+    parser.add_argument(
+        "corpus",
+        nargs="?",
+        default=str(Path(__file__).parent.parent / "corpus"),
+        help="directory of .nin files with optional .png and .solution files, or a glob (default: corpus/)",
+    )
+    parser.add_argument("-n", "--iterations", type=int, default=10, help="runs of every stage per puzzle")
+    parser.add_argument("-o", "--output", type=Path, default=None, help="write the JSON report here instead of stdout")
+    parser.add_argument("--warm-cache", action="store_true", help="keep the solver's line cache between runs")
+    parser.add_argument("--baseline", type=Path, default=None, help="JSON report of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p50 slowdown against the baseline")
+    args = parser.parse_args()
+
+    problem_paths = find_problems(args.corpus)
+    if not problem_paths:
+        print(f"No puzzles found: {args.corpus}", file=sys.stderr)
+        sys.exit(1)
+
+    with BoardReader() as reader:
+        cases = [benchmark_case(Path(path), reader, args.iterations, args.warm_cache) for path in problem_paths]
+
+    stages = {}
+    for stage in STAGES:
+        samples = [sample for case in cases for sample in case["samples"].get(stage, [])]
+        if samples:
+            stages[stage] = summarize(samples)
+    for case in cases:
+        case["stages"] = {stage: summarize(samples) for stage, samples in case.pop("samples").items()}
+
+    read_cases = [case for case in cases if "lines" in case]
+    report = {
+        "version": version(),
+        "iterations": args.iterations,
+        "warm_cache": args.warm_cache,
+        "stages": stages,
+        "accuracy": accuracy([case for case in read_cases if not case["synthetic"]]),
+        "synthetic_accuracy": accuracy([case for case in read_cases if case["synthetic"]]),
+        "solutions_invalid": [case["path"] for case in cases if not case["solution_valid"]],
+        "solutions_differ": [case["path"] for case in cases if case.get("solution_matches") is False],
+        "cases": cases,
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output is not None:
+        args.output.write_text(text)
+    else:
+        print(text)
+
+    failed = bool(report["solutions_invalid"])
+    if args.baseline is not None:
+        regressions = compare(report, json.loads(args.baseline.read_text()), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        failed |= bool(regressions)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,284 +1,333 @@
+from concurrent.futures import Executor, ThreadPoolExecutor
 from dataclasses import dataclass
 from typing import Literal, Sequence
 import cv2
 import numpy as np
-import pytesseract as tess
 import subprocess
 from pathlib import Path
-from math import sqrt
-from sklearn.cluster import KMeans
-from tqdm import tqdm
 
-class BoardReader:
-    SKIP_GRAB_SCREENSHOT = True
+from digit_recognizer import DigitRecognizer
+from frame_source import FrameSource
+from geometry import BoardGeometry
+from instrumentation import count, span, traced
+from puzzle_cache import PuzzleCache
+from solver import Candidates, LineCandidates
 
+class BoardReader:
     current_directory = Path(__file__).parent
     temp_path = current_directory.parent / "temp"
-    temp_path.mkdir(exist_ok=True)
     lib_path = current_directory.parent / "lib"
 
     # Image area constants
     YELLOW = np.array([0, 207, 221])  # BGR order
-    BLACK = np.array([0, 0, 0])  # BGR order
-    WHITE = np.array([255, 255, 255])  # BGR order
 
     IMAGE = None
-    size = None
-    top_left_x = None
-    top_left_y = None
-    bottom_right_x = None
-    bottom_right_y = None
+    geometry: BoardGeometry | None = None
+    board_key: str | None = None
+
+    def __init__(
+        self,
+        recognizer: DigitRecognizer | None = None,
+        ocr_workers: int | None = None,
+        frame_source: FrameSource | None = None,
+        cache: PuzzleCache | None = None,
+        executor: Executor | None = None,
+        debug_images=False,
+    ):
+        """
+        recognizer: digit recognizer, by default template matching with a Tesseract fallback
+        ocr_workers: threads used for Tesseract sheets, None for the ThreadPoolExecutor default
+        frame_source: read the screen from the scrcpy video stream instead of adb screenshots
+        cache: skip OCR for boards whose clue panels were read before, and Tesseract for glyphs read before
+        executor: runs the column clues while the row clues are read, and the Tesseract sheets of the default
+            recognizer. It needs at least 2 workers, as the column task waits for its sheets, and a
+            ThreadPoolExecutor with fewer is rejected. By default the reader creates one, shut down by close().
+        debug_images: save the clue panels, the thresholded column panel and every column digit to temp/
+        """
+        self.debug_images = debug_images
+        self.frame_source = frame_source
+        self.cache = cache
+        # the column task blocks on OCR sheets queued behind it, a single worker would never run them
+        if isinstance(executor, ThreadPoolExecutor) and executor._max_workers < 2:
+            raise Exception("The reader's executor has 1 worker, it needs at least 2")
+        self.owns_executor = executor is None
+        # one more worker than the sheets, for the column task waiting on them
+        self.executor = executor if executor is not None else ThreadPoolExecutor(
+            None if ocr_workers is None else ocr_workers + 1, thread_name_prefix="reader"
+        )
+        if recognizer is None:
+            recognizer = DigitRecognizer(executor=self.executor, cache=cache)
+        self.recognizer = recognizer
 
-    @staticmethod
-    def is_color(pixel, color, threshold=1000.0):
-        return ((color - pixel) ** 2).mean() < threshold
+    def close(self):
+        """Shut down the executor if the reader created it."""
+        if self.owns_executor:
+            self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    @traced("detect_board_size")
+    def detect_board_size(self) -> BoardGeometry:
+        """Find the grid of empty cells on screen from projection profiles of the thresholded screenshot.
 
-    def detect_board_size(self, k_means_filtering=False):
+        Rows of cells show up in the row profile as a chain of equally sized, equally spaced runs of white,
+        separated by the grid lines. The rows are found across the whole screen first, then the columns
+        within those rows, then the rows again within the columns, which leaves out the clue panels.
+        """
         if self.IMAGE is None:
             raise Exception("No image loaded")
-        
+
         GRAY = cv2.cvtColor(self.IMAGE, cv2.COLOR_BGR2GRAY)
-        MONO = cv2.threshold(GRAY, 180, 255, cv2.THRESH_BINARY)[1]
-        contours, _ = cv2.findContours(MONO, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
-
-        # filter for contours with 4 axis-aligned equal sides        
-        contours_filtered = []
-        for contour in contours:
-            if len(contour) != 4:
-                continue # need 4 sides
-
-            _, _, w, h = cv2.boundingRect(contour)
-            if abs(w - h) > 3:
-                continue # bounding box not square enough
-
-            bounding_area = (w - 1) * (h - 1)
-            contour_area = cv2.contourArea(contour)
-
-            if contour_area == 0 or contour_area != bounding_area:
-                continue # empty or not square contour
-
-            contours_filtered.append(contour)
-        
-
-        if k_means_filtering:
-            contours_data = [
-                {
-                    "area": cv2.contourArea(contour),
-                    "contour": contour,
-                    "is_small_cluster": False,
-                }
-                for contour in contours_filtered
-            ]
-
-            # cluster contours by area
-            areas = np.array([c["area"] for c in contours_data])
-            km = KMeans(n_clusters=2)
-            km.fit(areas.reshape(-1, 1))
-
-            # remove small clusters
-            cluster_sizes = np.bincount(km.labels_)
-            for i, size in enumerate(cluster_sizes):
-                if size < 15:
-                    for j, label in enumerate(km.labels_):
-                        if label == i:
-                            contours_data[j]["is_small_cluster"] = True
-
-            cell_contours_data = [c for c in contours_data if not c["is_small_cluster"]]
-            cell_contours = [c["contour"] for c in cell_contours_data]
-        else:
-            cell_contours = contours_filtered
-
-        # calculate board size
-        cells = len(cell_contours)
-        side = int(sqrt(cells))
-        if side * side != cells:
-            raise Exception("Warning: not square board")
-
-        self.size = side
-
-        # calculate board area
-        hull = cv2.convexHull(np.concatenate(cell_contours))
-        self.top_left_x = hull[hull[:, :, 0].argmin()][0][0]
-        self.top_left_y = hull[hull[:, :, 1].argmin()][0][1]
-        self.bottom_right_x = hull[hull[:, :, 0].argmax()][0][0]
-        self.bottom_right_y = hull[hull[:, :, 1].argmax()][0][1]
+        MONO = cv2.threshold(GRAY, 180, 1, cv2.THRESH_BINARY)[1]
+
+        row_starts, row_ends = self.grid_runs(cv2.reduce(MONO, 1, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel())
+        band = MONO[row_starts[0] : row_ends[-1]]
+        col_starts, col_ends = self.grid_runs(
+            cv2.reduce(band, 0, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel(), whole=True
+        )
+        band = MONO[:, col_starts[0] : col_ends[-1]]
+        row_starts, row_ends = self.grid_runs(
+            cv2.reduce(band, 1, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel(), whole=True
+        )
+
+        rows, cols = len(row_starts), len(col_starts)
+        pitch_x = (col_starts[-1] - col_starts[0]) / (cols - 1) if cols > 1 else float(col_ends[0] - col_starts[0])
+        pitch_y = (row_starts[-1] - row_starts[0]) / (rows - 1) if rows > 1 else float(row_ends[0] - row_starts[0])
+
+        # every cell of the grid must be white in the middle
+        centers_x = ((col_starts + col_ends) // 2)[np.newaxis, :]
+        centers_y = ((row_starts + row_ends) // 2)[:, np.newaxis]
+        if not MONO[centers_y, centers_x].all():
+            raise Exception(f"No {rows}x{cols} grid of empty cells found")
+
+        self.geometry = BoardGeometry(
+            left=int(col_starts[0]),
+            top=int(row_starts[0]),
+            right=round(col_starts[0] + pitch_x * cols),
+            bottom=round(row_starts[0] + pitch_y * rows),
+            rows=rows,
+            cols=cols,
+            screen_width=self.IMAGE.shape[1],
+            screen_height=self.IMAGE.shape[0],
+        )
+        return self.geometry
 
     @staticmethod
-    def digits_to_numbers(input_text, colors, fullcolor):
-        try:
-            if len(input_text) > len(colors):
-                raise Exception("Warning: too few colors")
-            elif len(input_text) < len(colors):
-                raise Exception("Warning: too many colors")
-            else:
-                numbers = []
-                second_number = False
-                for index, char in enumerate(input_text):
-                    if char.isdigit():
-                        color = colors[index]
-                        if second_number and color == "yellow":
-                            last_number = numbers.pop()
-                            numbers.append(last_number * 10 + int(char))
-                            second_number = False
-                        elif second_number and not color == "yellow":
-                            raise Exception(
-                                "Warning: yellow number not followed by yellow number"
-                            )
-                        elif not second_number and color == "white":
-                            numbers.append(int(char))
-                        elif not second_number and color == "yellow":
-                            numbers.append(int(char))
-                            second_number = True
-                    else:
-                        raise Exception("Warning: non-numeric character")
-        except Exception as e:
-            message = e.args
-            print(message)
-            cv2.imshow("row_preview", fullcolor)
-            cv2.waitKey(1)
-            input_text = input().split(" ")
-            numbers = [int(i) for i in input_text]
+    def grid_runs(profile: np.ndarray, min_size=4, whole=False) -> tuple[np.ndarray, np.ndarray]:
+        """The longest chain of equally sized, equally spaced runs in a projection profile.
 
-        return numbers
+        A run is a stretch of the profile above half its maximum. Sizes may differ by 2 pixels or 10%,
+        whichever is more. Each spacing is compared with the median spacing of the chain so far and may differ
+        by 2 pixels or 25%, e.g. for the thicker line after every 5th cell.
 
+        Args:
+            whole: the profile is of the board alone, so the chain must span the runs of its size. Otherwise a
+                chain cut short, e.g. by a grid line thicker than expected, would be taken for the board.
 
-    NumberColorType = Literal["yellow", "white"]
+        Returns:
+            The start and end (exclusive) of every run in the chain.
+        """
+        occupied = np.zeros(len(profile) + 2, dtype=np.int8)
+        occupied[1:-1] = profile * 2 > profile.max()
+        edges = np.flatnonzero(np.diff(occupied))
+        starts, ends = edges[0::2], edges[1::2]
+        keep = ends - starts >= min_size
+        starts, ends = starts[keep], ends[keep]
+        if len(starts) == 0:
+            raise Exception("No board cells found")
+
+        sizes = ends - starts
+        best_start, best_end = 0, 1
+        i = 0
+        while i < len(starts) - 1:
+            tolerance = max(2, sizes[i] // 10)
+            spacings = [starts[i + 1] - starts[i]]
+            j = i + 1
+            while j < len(starts) and abs(sizes[j] - sizes[i]) <= tolerance:
+                spacing = starts[j] - starts[j - 1]
+                median = float(np.median(spacings))
+                if abs(spacing - median) > max(2.0, median / 4):
+                    break
+                spacings.append(spacing)
+                j += 1
+            if j - i > best_end - best_start:
+                best_start, best_end = i, j
+            i = max(i + 1, j - 1)
+
+        if whole:
+            size = sizes[best_start]
+            similar = np.flatnonzero(np.abs(sizes - size) <= max(2, size // 10))
+            span = ends[similar[-1]] - starts[similar[0]]
+            if ends[best_end - 1] - starts[best_start] < 0.8 * span:
+                raise Exception(
+                    f"Found a grid of {best_end - best_start} cells spanning only part of the {span} pixels of the board"
+                )
 
+        return starts[best_start:best_end], ends[best_start:best_end]
 
     @staticmethod
-    def row_to_colors(row: np.ndarray, row_fullcolor) -> list[NumberColorType]:
-        """Extracts colors from a row of numbers. If there are n numbers, there will be n colors.
+    def join_digits(first: Candidates, second: Candidates) -> Candidates:
+        """Candidates of a two-digit number, from the candidates of its digits."""
+        joined = [(a * 10 + b, p * q) for a, p in first for b, q in second]
+        return sorted(joined, key=lambda candidate: -candidate[1])
 
-        Cast a ray at the middle of the row to find first number. Then find rightmost pixel of the number using 2D flood fill.
-        Cast another ray from the rightmost pixel to find the next number.
+    @staticmethod
+    def digits_to_numbers(digits: list[Candidates], colors: list["BoardReader.NumberColorType"]) -> LineCandidates:
+        """Join the digits of a row into clue numbers. Two-digit numbers are drawn with two yellow digits.
+
+        A yellow digit followed by a white one means one of the two colors was misjudged. Both splits of the row
+        are kept for Solver.resolve_clues, with half the confidence each: the two digits joined, or the two digits
+        apart. A yellow digit ending the row is taken as a single digit.
         """
+        if len(digits) != len(colors):
+            raise Exception(f"Read {len(digits)} digits but {len(colors)} colors")
+
+        def halved(candidates: Candidates) -> Candidates:
+            return [(value, confidence / 2) for value, confidence in candidates]
+
+        splits: LineCandidates = [[]]
+        second_number = False
+        for digit, color in zip(digits, colors):
+            if second_number and color == "yellow":
+                for numbers in splits:
+                    numbers.append(BoardReader.join_digits(numbers.pop(), digit))
+            elif second_number:
+                joined = [numbers[:-1] + [halved(BoardReader.join_digits(numbers[-1], digit))] for numbers in splits]
+                apart = [numbers[:-1] + [halved(numbers[-1]), digit] for numbers in splits]
+                splits = joined + apart
+            else:
+                for numbers in splits:
+                    numbers.append(digit)
+            second_number = not second_number and color == "yellow"
 
-        colors: list[BoardReader.NumberColorType] = []
-
-        scan_x = 0  # start from the left
-        while scan_x < row.shape[1]:
-            # find first black pixel
-            while (
-                scan_x < row.shape[1]
-                and not np.equal(row[:, scan_x], BoardReader.BLACK).all(axis=1).any()
-            ):
-                scan_x += 1
-
-            if scan_x >= row.shape[1]:  # end of row reached
-                break
-            else:  # number found
-                num_y = 0
-                while not np.array_equal(row[num_y, scan_x], BoardReader.BLACK):
-                    num_y += 1
-
-                visited: set[tuple[int, int]] = set()
-                remaining: set[tuple[int, int]] = set()
-                rightmost_x = scan_x
-
-                # find rightmost pixel of the number using flood fill
-                remaining.add((scan_x, num_y))
-                while len(remaining) > 0:
-                    x, y = remaining.pop()
-                    if (x, y) in visited:
-                        continue
-                    visited.add((x, y))
-
-                    if x > rightmost_x:
-                        rightmost_x = x
-
-                    # check neighbors
-                    for dy in [-1, 0, 1]:
-                        for dx in [-1, 0, 1]:
-                            ny, nx = y + dy, x + dx
-                            if (
-                                (dy == 0 and dx == 0)  # skip self
-                                or ((nx, ny) in visited)  # skip already visited
-                                or not (0 <= ny < row.shape[0])
-                                or not (0 <= nx < row.shape[1])  # skip out of bounds
-                            ):
-                                continue
-
-                            if np.array_equal(row[ny, nx], BoardReader.BLACK):
-                                remaining.add((nx, ny))
-
-                # check if yellow or white
-                visited_is_yellow = [
-                    BoardReader.is_color(row_fullcolor[y, x], BoardReader.YELLOW) for x, y in visited
-                ]
-                if sum(visited_is_yellow) > len(visited) / 2:
-                    colors.append("yellow")  # likely yellow
-                else:
-                    colors.append("white")  # likely white
+        return splits
 
-                scan_x = rightmost_x + 1  # move to the next pixel after the number
+    @staticmethod
+    def most_likely(lines: list[LineCandidates]) -> list[list[int]]:
+        """The most likely value of every clue number, in the most likely split of each line."""
 
-        return colors
+        def likelihood(numbers: list[Candidates]) -> float:
+            return float(np.prod([number[0][1] for number in numbers]))
+
+        return [[number[0][0] for number in max(line, key=likelihood)] for line in lines]
+
+
+    NumberColorType = Literal["yellow", "white"]
 
 
     @staticmethod
-    def row_to_text(I, fullcolor):
-        colors = BoardReader.row_to_colors(I, fullcolor)
+    def label_digits(mono: np.ndarray, fullcolor: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Label every digit blob of a clue panel with 8-connectivity.
+
+        Returns the label image, the cv2 stats of each blob (background dropped, so blob i has label i + 1)
+        and whether each blob is yellow. A blob is yellow if most of its pixels are close to YELLOW in the
+        full color image.
+        """
+        blobs, labels, stats, _ = cv2.connectedComponentsWithStats(mono, connectivity=8)
+
+        ys, xs = np.nonzero(labels)
+        count("digit_pixels", len(ys))
+        pixels = fullcolor[ys, xs].astype(np.int32)
+        is_yellow = ((BoardReader.YELLOW - pixels) ** 2).mean(axis=1) < 1000.0
+        yellow_votes = np.bincount(labels[ys, xs], weights=is_yellow, minlength=blobs)
+        yellow = yellow_votes > stats[:, cv2.CC_STAT_AREA] / 2
+
+        return labels, stats[1:], yellow[1:]
 
-        input_text = list(tess.image_to_string(I, config="--psm 6").replace("\n", ""))
 
-        numbers = BoardReader.digits_to_numbers(input_text, colors, fullcolor)
+    @staticmethod
+    def order_blobs(stats: np.ndarray) -> list[int]:
+        """Order digit blobs left to right. Blobs starting inside the previous blob's horizontal span are skipped."""
+        ordered = []
+
+        rightmost_x = -1
+        for i in np.lexsort((stats[:, cv2.CC_STAT_TOP], stats[:, cv2.CC_STAT_LEFT])):
+            left = stats[i, cv2.CC_STAT_LEFT]
+            if left <= rightmost_x:
+                continue
+            rightmost_x = left + stats[i, cv2.CC_STAT_WIDTH] - 1
+            ordered.append(int(i))
 
-        return numbers
+        return ordered
 
 
     @staticmethod
-    def split_rows(fullcolor):
+    def blob_image(labels: np.ndarray, stats: np.ndarray, index: int) -> np.ndarray:
+        """Cut blob `index` out of the label image as a white on black digit."""
+        x, y, w, h = stats[index, :4]
+        return (labels[y : y + h, x : x + w] == index + 1).astype(np.uint8) * 255
+
+
+    @traced("split_rows")
+    def split_rows(self, fullcolor, geometry: BoardGeometry, show=False) -> list[LineCandidates]:
         I = fullcolor[:, :, 1]
         I = cv2.threshold(I, 180, 255, cv2.THRESH_BINARY)[1]
 
+        # label digits once for the whole panel, then hand each row the blobs centered in it
+        labels, stats, yellow = self.label_digits(I, fullcolor)
+        blob_rows = np.array(
+            [
+                geometry.row_of(top + height / 2)
+                for top, height in zip(stats[:, cv2.CC_STAT_TOP], stats[:, cv2.CC_STAT_HEIGHT])
+            ],
+            dtype=int,
+        )
+
+        rows_ordered = []
+        for row_index in range(geometry.rows):
+            in_row = np.flatnonzero(blob_rows == row_index)
+            rows_ordered.append([int(in_row[i]) for i in self.order_blobs(stats[in_row])])
+
+        # recognize every digit of the panel in one batch
+        digits = [self.blob_image(labels, stats, i) for ordered in rows_ordered for i in ordered]
+        candidates = iter(self.recognizer.recognize_candidates(digits))
+
         rows = []
-        top = 0
-        bottom = 0
-        while True:
-            while np.sum(I[bottom]) == 0:
-                bottom += 1
-                if bottom >= I.shape[0] - 1:
-                    return rows
-            top = bottom
-            while np.sum(I[bottom]) != 0:
-                bottom += 1
-            row = 255 - np.zeros([bottom - top + 10, I.shape[1]], dtype=np.uint8)
-            row[5 : 5 + bottom - top, :] = 255 - I[top:bottom, :]
-            row = np.stack([row, row, row], axis=2)
+        for row_index, ordered in enumerate(rows_ordered):
+            if show:
+                top = int(row_index * geometry.pitch_y)
+                cv2.imshow("1", I[top : int(top + geometry.pitch_y)])
+                cv2.waitKey(1)
 
-            row_fullcolor = np.zeros([bottom - top + 10, I.shape[1], 3], dtype=np.uint8)
-            row_fullcolor[5 : 5 + bottom - top, :, :] = fullcolor[top:bottom, :, :]
+            colors: list[BoardReader.NumberColorType] = ["yellow" if yellow[i] else "white" for i in ordered]
+            row_digits = [digit for _, digit in zip(ordered, candidates)]
 
-            cv2.imshow("1", row)
-            cv2.waitKey(1)
+            rows.append(self.digits_to_numbers(row_digits, colors))
 
-            rows.append(BoardReader.row_to_text(row, row_fullcolor))
+        return rows
 
 
     @dataclass
     class DigitInfo:
-        value: int
+        value: Candidates
         contour: Sequence[cv2.typing.MatLike]
         center: tuple[float, float]
         top: int
         bottom: int
 
 
-    @staticmethod
-    def split_cols(fullcolor, side: int) -> list[list[int]]:
+    @traced("split_cols")
+    def split_cols(self, fullcolor, geometry: BoardGeometry) -> list[LineCandidates]:
         I = fullcolor[:, :, 1]
         I = cv2.threshold(I, 150, 255, cv2.THRESH_BINARY)[1]
 
-        BoardReader.debug_img(I, "mono")
+        self.debug_img(I, "mono")
 
-        cols_digit_infos: list[list[BoardReader.DigitInfo]] = [[] for _ in range(side)]
+        cols_digit_infos: list[list[BoardReader.DigitInfo]] = [[] for _ in range(geometry.cols)]
+        digit_infos: list[BoardReader.DigitInfo] = []
+        digits: list[np.ndarray] = []
 
         # find digit contours
         contours, hierarchy = cv2.findContours(I, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+        count("digit_pixels", cv2.countNonZero(I))
         contours = [contour for contour in contours if len(contour) != 4]
 
         padding = 3
-        for i, contour in enumerate(tqdm(contours)):
+        for i, contour in enumerate(contours):
             if hierarchy[0][i][3] != -1:
                 # skip contours that are children of other contours
                 continue
@@ -306,24 +355,6 @@ class BoardReader:
 
                 next_child_index = hierarchy[0][next_child_index][0]
 
-            # recognize
-            try:
-                text = tess.image_to_string(
-                    digit, config="--psm 10 digits"
-                )  # psm 10 for single character
-                text = text.strip()
-                number = int(text)
-            except ValueError:
-                # dilate digit to make it more recognizable
-                dilated_digit = cv2.dilate(digit, np.ones((2, 2), np.uint8), iterations=1)
-
-                # dilated digit too fat, try to recognize without dilation
-                text = tess.image_to_string(
-                    dilated_digit, config="--psm 10 digits"
-                )  # psm 10 for single characters
-                text = text.strip()
-                number = int(text)
-
             # find center of the digit
             M = cv2.moments(contour)
             center = (
@@ -331,18 +362,24 @@ class BoardReader:
                 M["m01"] / M["m00"],  # y coordinate of the center
             )
             # determine column index
-            column_index = int(center[0] / (fullcolor.shape[1] / side))
-            BoardReader.debug_img(digit, f"digit_{column_index}_{len(cols_digit_infos[column_index])}")
+            column_index = geometry.column_of(center[0])
+            self.debug_img(digit, f"digit_{column_index}_{len(cols_digit_infos[column_index])}")
 
+            digits.append(digit)
             cols_digit_infos[column_index].append(
                 BoardReader.DigitInfo(
-                    value=number,
+                    value=[],  # recognized below, together with all other digits
                     contour=digit_contour,
                     center=center,
                     top=y,
                     bottom=y + h,
                 )
             )
+            digit_infos.append(cols_digit_infos[column_index][-1])
+
+        # recognize
+        for digit_info, candidates in zip(digit_infos, self.recognizer.recognize_candidates(digits)):
+            digit_info.value = candidates
 
         cols = []
         for col_digit_infos in cols_digit_infos:
@@ -367,9 +404,9 @@ class BoardReader:
                     ):
                         # two-digit number, leftmost digit is the first one
                         if digit_info.center[0] < next_digit_info.center[0]:
-                            col.append(digit_info.value * 10 + next_digit_info.value)
+                            col.append(BoardReader.join_digits(digit_info.value, next_digit_info.value))
                         else:
-                            col.append(next_digit_info.value * 10 + digit_info.value)
+                            col.append(BoardReader.join_digits(next_digit_info.value, digit_info.value))
 
                         i += 1  # skip next digit, because it was already processed
 
@@ -379,56 +416,52 @@ class BoardReader:
 
                 i += 1
 
-            cols.append(col)
+            cols.append([col])  # columns are split by position, not by color, so there is one split
 
         return cols
 
 
-    def cell_to_coordinates_30(self, left, top):
-        if self.size is None or self.top_left_x is None or self.top_left_y is None or self.bottom_right_x is None or self.bottom_right_y is None:
-            raise Exception("Board size and area not detected")
-
-        cellsize = (self.bottom_right_x - self.top_left_x) / float(self.size)
-        x = int(self.top_left_x + cellsize / 2.0 + left * cellsize)
-        y = int(self.top_left_y + cellsize / 2.0 + top * cellsize)
-
-        return x, y
-
-
     @staticmethod
-    def grab_screenshot(to_path: Path):
-        """Take screenshot of the device and save it to the specified path.
+    def capture_screenshot() -> np.ndarray:
+        """Capture the device screen straight into memory as a BGR image.
 
-        Args:
-            to_path (Path): The path where the screenshot will be saved as screen.png.
+        `adb exec-out screencap` without -p streams the raw framebuffer: a little-endian header
+        (width, height, pixel format and, since Android 9, color space) followed by RGBA pixels.
+        The pixels are read in place from the adb output, no file or PNG round trip is involved.
         """
         adb_path = BoardReader.current_directory.parent / "lib/adb/adb.exe"
-        subprocess.run([adb_path, "devices"])
-        subprocess.run(
-            [
-                adb_path,
-                "shell",
-                "screencap",
-                "-p",
-                "/sdcard/screen.png",
-            ]
-        )
-        subprocess.run([adb_path, "pull", "/sdcard/screen.png"], cwd=to_path)
+        raw = subprocess.run([adb_path, "exec-out", "screencap"], check=True, capture_output=True).stdout
 
+        width, height, pixel_format = (int(n) for n in np.frombuffer(raw, dtype="<u4", count=3))
+        if pixel_format != 1:  # PIXEL_FORMAT_RGBA_8888
+            raise Exception(f"Unsupported screencap pixel format: {pixel_format}")
 
-    @staticmethod
-    def debug_img(img: np.ndarray, name: str = "debug"):
-        """Save a debug image to the temp path with the specified name."""
+        header = len(raw) - width * height * 4
+        if header not in (12, 16):
+            raise Exception("Unexpected screencap size")
+
+        rgba = np.frombuffer(raw, dtype=np.uint8, offset=header).reshape(height, width, 4)
+        return cv2.cvtColor(rgba, cv2.COLOR_RGBA2BGR)
 
+
+    @staticmethod
+    def save_image(img: np.ndarray, path: Path):
+        """Save an image as PNG. Unlike cv2.imwrite this works with non-ASCII paths on Windows."""
         success, encoded = cv2.imencode(".png", img)
         if not success:
-            return
-        
-        path = BoardReader.temp_path / f"{name}.png"
+            raise Exception(f"Failed to encode {path}")
+
+        path.parent.mkdir(parents=True, exist_ok=True)
         with open(path, "wb") as f:
             encoded.tofile(f)
 
 
+    def debug_img(self, img: np.ndarray, name: str = "debug"):
+        """Save a debug image to the temp path with the specified name, if debug_images is set."""
+        if self.debug_images:
+            self.save_image(img, self.temp_path / f"{name}.png")
+
+
     @staticmethod
     def print_to_file(file_path: Path, rows: list[list[int]], cols: list[list[int]]):
         with open(file_path, "w") as f:
@@ -440,42 +473,58 @@ class BoardReader:
                 f.write(" ".join(str(num) for num in col) + "\n")
 
 
-    def run(self) -> tuple[list[list[int]], list[list[int]]]:
-        if not self.SKIP_GRAB_SCREENSHOT:
-            self.grab_screenshot(self.temp_path)
+    @traced("read_board")
+    def run_candidates(
+        self, screenshot_path: Path | None = None
+    ) -> tuple[list[LineCandidates], list[LineCandidates]]:
+        """Read the clues of the board on screen, keeping the alternatives of uncertain digits.
 
-        screenshot_path = self.temp_path / "screen.png"
-        self.IMAGE = cv2.imdecode(np.fromfile(screenshot_path, dtype=np.uint8), cv2.IMREAD_COLOR)
+        Args:
+            screenshot_path (Path | None): Replay a saved screenshot instead of capturing the device.
+
+        Returns:
+            The splits of each row and column into clue numbers, each number with its (value, confidence)
+            candidates, most likely first. Solver.resolve_clues picks the consistent reading. Clues of a cached board come back certain.
+        """
+        with span("capture"):
+            if screenshot_path is not None:
+                self.IMAGE = cv2.imdecode(np.fromfile(screenshot_path, dtype=np.uint8), cv2.IMREAD_COLOR)
+            elif self.frame_source is not None:
+                self.IMAGE = self.frame_source.latest_frame()
+            else:
+                self.IMAGE = self.capture_screenshot()
         if self.IMAGE is None:
             raise Exception("Failed to load image")
 
         # Detect board size
-        self.detect_board_size()
-        if self.size is None or self.top_left_x is None or self.top_left_y is None or self.bottom_right_x is None or self.bottom_right_y is None:
-            raise Exception("Failed to detect board size and area")
+        geometry = self.detect_board_size()
 
         # Prepare image area arrays
-        LEFT = self.IMAGE[self.top_left_y:self.bottom_right_y, 0:self.top_left_x]
-        self.debug_img(LEFT, "left")
+        LEFT = self.IMAGE[geometry.top:geometry.bottom, 0:geometry.left]
+        TOP = self.IMAGE[0:geometry.top, geometry.left:geometry.right]
+
+        if self.cache is not None:
+            self.board_key = self.cache.board_key(LEFT, TOP)
+            known = self.cache.lookup_board(self.board_key)
+            if known is not None:
+                count("board_cache_hits")
+                rows, cols = known
+                return (
+                    [[[[(n, 1.0)] for n in row]] for row in rows],
+                    [[[[(n, 1.0)] for n in col]] for col in cols],
+                )
 
-        TOP = self.IMAGE[0:self.top_left_y, self.top_left_x:self.bottom_right_x]
+        self.debug_img(LEFT, "left")
         self.debug_img(TOP, "top")
 
-        rows = self.split_rows(LEFT)
-        cols = self.split_cols(TOP, self.size)
-
-        rowsum = sum(sum(row) for row in rows)
-        colsum = sum(sum(col) for col in cols)
-        
-        if len(rows) != 30 or len(cols) != 30 or rowsum != colsum:
-            if len(rows) != 30:
-                print("Too few rows: " + str(len(rows)))
-            if len(cols) != 30:
-                print("Too few columns: " + str(len(cols)))
-            if rowsum != colsum:
-                print("Row sum is " + str(rowsum))
-                print("Column sum is " + str(colsum))
-            print("Waiting for manual fix...")
-            input()
+        # rows and columns are independent, read the columns on the executor meanwhile
+        cols_future = self.executor.submit(self.split_cols, TOP, geometry)
+        rows = self.split_rows(LEFT, geometry)
+        cols = cols_future.result()
+
+        if len(rows) != geometry.rows or len(cols) != geometry.cols:
+            raise Exception(
+                f"Board is {geometry.rows}x{geometry.cols}, read clues for {len(rows)} rows and {len(cols)} columns"
+            )
 
         return rows, cols
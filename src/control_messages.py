@@ -0,0 +1,143 @@
+import struct
+
+# scrcpy control protocol, see app/src/control_msg.h in scrcpy
+TYPE_INJECT_KEYCODE = 0
+TYPE_INJECT_TOUCH_EVENT = 2
+
+ACTION_DOWN = 0  # AKEY_EVENT_ACTION_DOWN / AMOTION_EVENT_ACTION_DOWN
+ACTION_UP = 1
+ACTION_MOVE = 2
+
+POINTER_ID_GENERIC_FINGER = -2  # 0xFFFFFFFFFFFFFFFE
+BUTTON_PRIMARY = 1  # AMOTION_EVENT_BUTTON_PRIMARY
+
+# type, action, pointer id, x, y, screen width, screen height, pressure, action button, buttons
+TOUCH = struct.Struct(">BBqiiHHHII")
+# type, action, keycode, repeat, meta state
+KEY = struct.Struct(">BBiii")
+
+
+class ControlMessageEncoder:
+    """
+    Packs scrcpy control messages with precompiled structs into a preallocated ring buffer.
+
+    Every encode call returns a memoryview into the ring. It stays valid until the ring wraps around
+    onto it, i.e. until about `capacity` more bytes have been encoded: send it right away or copy it.
+    A whole gesture, or a whole batch of gestures, is encoded contiguously in one call.
+
+    Example:
+    >>> encoder = ControlMessageEncoder(1080, 2400)
+    >>> conn.sendall(encoder.gesture([(100, 100), (100, 160)]))
+    """
+
+    def __init__(self, width: int, height: int, capacity=1 << 16):
+        self.width = width
+        self.height = height
+        self.buffer = bytearray(capacity)
+        self.view = memoryview(self.buffer)
+        self.offset = 0
+
+    def __reserve(self, size: int) -> int:
+        """Start offset of `size` contiguous free bytes, wrapping around or growing the ring as needed."""
+        if size > len(self.buffer):
+            self.buffer = bytearray(max(size, 2 * len(self.buffer)))
+            self.view = memoryview(self.buffer)
+            self.offset = 0
+        elif self.offset + size > len(self.buffer):
+            self.offset = 0
+
+        start = self.offset
+        self.offset += size
+        return start
+
+    def __pack_touch(self, offset: int, action: int, x: int, y: int) -> int:
+        if action == ACTION_UP:
+            pressure, action_button, buttons = 0x0000, BUTTON_PRIMARY, 0
+        elif action == ACTION_DOWN:
+            pressure, action_button, buttons = 0xFFFF, BUTTON_PRIMARY, BUTTON_PRIMARY
+        else:
+            pressure, action_button, buttons = 0xFFFF, 0, BUTTON_PRIMARY
+
+        TOUCH.pack_into(
+            self.buffer,
+            offset,
+            TYPE_INJECT_TOUCH_EVENT,
+            action,
+            POINTER_ID_GENERIC_FINGER,
+            x,
+            y,
+            self.width,
+            self.height,
+            pressure,
+            action_button,
+            buttons,
+        )
+        return offset + TOUCH.size
+
+    def __pack_gesture(self, offset: int, points: list[tuple[int, int]]) -> int:
+        (x, y), *rest = points
+        offset = self.__pack_touch(offset, ACTION_DOWN, x, y)
+
+        # moves are the bulk of a stroke, pack them without the per-message dispatch
+        pack_into, buffer, size = TOUCH.pack_into, self.buffer, TOUCH.size
+        width, height = self.width, self.height
+        for x, y in rest:
+            pack_into(
+                buffer,
+                offset,
+                TYPE_INJECT_TOUCH_EVENT,
+                ACTION_MOVE,
+                POINTER_ID_GENERIC_FINGER,
+                x,
+                y,
+                width,
+                height,
+                0xFFFF,  # pressure
+                0,  # no action button
+                BUTTON_PRIMARY,
+            )
+            offset += size
+
+        return self.__pack_touch(offset, ACTION_UP, x, y)
+
+    def touch(self, action: int, x: int, y: int) -> memoryview:
+        """A single touch message."""
+        start = self.__reserve(TOUCH.size)
+        self.__pack_touch(start, action, x, y)
+        return self.view[start : start + TOUCH.size]
+
+    def key(self, action: int, keycode: int, repeat=0, meta_state=0) -> memoryview:
+        """A single key message, keycode being an Android AKEYCODE_* value."""
+        start = self.__reserve(KEY.size)
+        KEY.pack_into(self.buffer, start, TYPE_INJECT_KEYCODE, action, keycode, repeat, meta_state)
+        return self.view[start : start + KEY.size]
+
+    @staticmethod
+    def gesture_size(points: list[tuple[int, int]]) -> int:
+        """Size of an encoded gesture: down, one move per following point, up."""
+        return (len(points) + 1) * TOUCH.size
+
+    def gesture(self, points: list[tuple[int, int]]) -> memoryview:
+        """Down on the first point, a move to each following point, up on the last. A single point is a tap."""
+        size = self.gesture_size(points)
+        start = self.__reserve(size)
+        self.__pack_gesture(start, points)
+        return self.view[start : start + size]
+
+    def batch(self, gestures: list[list[tuple[int, int]]]) -> tuple[memoryview, list[int]]:
+        """Encode several gestures contiguously.
+
+        Returns:
+            The encoded messages and the end offset of each gesture within them.
+        """
+        ends = []
+        size = 0
+        for points in gestures:
+            size += self.gesture_size(points)
+            ends.append(size)
+
+        start = self.__reserve(size)
+        offset = start
+        for points in gestures:
+            offset = self.__pack_gesture(offset, points)
+        return self.view[start : start + size], ends
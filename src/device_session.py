@@ -0,0 +1,161 @@
+import hashlib
+import pathlib
+import socket
+import subprocess
+
+from frame_source import FrameSource
+
+
+class DeviceSession:
+    """
+    DeviceSession owns the scrcpy server on the device and the sockets to it, and keeps them open
+    across puzzles. Only one connected device is supported.
+
+    Setup is skipped where possible: the server jar is pushed only if its hash differs from the one on
+    the device, and the adb reverse tunnel is reused if it is already in place. A server that died is
+    restarted on the next start().
+
+    Example:
+    >>> with DeviceSession() as session:
+    >>>   for puzzle in puzzles:
+    >>>     with TouchHandler(session=session) as touch_handler:
+    >>>       touch_handler.add_touch(100, 100)
+    """
+
+    DEVICE_JAR_PATH = "/data/local/tmp/scrcpy-server.jar"
+    SCRCPY_VERSION = "3.2"
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=27183,
+        frame_source: FrameSource | None = None,
+        connect_timeout=10.0,
+    ):
+        self.current_directory = str(pathlib.Path(__file__).parent.resolve()) + "/"
+        self.adb_path = self.current_directory + "../lib/adb/adb.exe"
+        self.jar_path = pathlib.Path(self.current_directory + "../lib/scrcpy/scrcpy-server")
+
+        self.host = host
+        self.port = port
+        self.frame_source = frame_source
+        self.connect_timeout = connect_timeout
+
+        self.server_process: subprocess.Popen | None = None
+        self.control_conn: socket.socket | None = None
+
+    def __adb(self, *args: str) -> str:
+        return subprocess.check_output([self.adb_path, *args]).decode("utf-8", errors="replace")
+
+    def __push_server(self):
+        local_hash = hashlib.sha256(self.jar_path.read_bytes()).hexdigest()
+        try:
+            device_hash = self.__adb("shell", "sha256sum", self.DEVICE_JAR_PATH).split()[0]
+        except (subprocess.CalledProcessError, IndexError):
+            device_hash = None
+
+        if device_hash != local_hash:
+            self.__adb("push", str(self.jar_path), self.DEVICE_JAR_PATH)
+
+    def __reverse_tunnel(self):
+        tunnel = f"localabstract:scrcpy tcp:{self.port}"
+        if tunnel not in self.__adb("reverse", "--list"):
+            self.__adb("reverse", "localabstract:scrcpy", f"tcp:{self.port}")
+
+    def screen_size(self) -> tuple[int, int]:
+        """Screen (width, height) in pixels from `wm size`. An override size, if set, takes precedence."""
+        sizes = {}
+        for line in self.__adb("shell", "wm", "size").splitlines():
+            kind, _, size = line.partition(":")
+            if "x" in size:
+                width, height = size.strip().split("x")
+                sizes[kind.strip()] = (int(width), int(height))
+
+        size = sizes.get("Override size", sizes.get("Physical size"))
+        if size is None:
+            raise Exception("Failed to read the screen size of the device")
+        return size
+
+    def is_running(self) -> bool:
+        return (
+            self.control_conn is not None
+            and self.server_process is not None
+            and self.server_process.poll() is None
+        )
+
+    def start(self):
+        """Start the server and connect to it, unless the session is already running."""
+        if self.is_running():
+            return
+        self.close()
+
+        self.__adb("devices")
+        self.__reverse_tunnel()
+        self.__push_server()
+
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            s.bind((self.host, self.port))
+            s.listen()
+            s.settimeout(self.connect_timeout)
+
+            self.server_process = subprocess.Popen(
+                [
+                    self.adb_path,
+                    "shell",
+                    f"CLASSPATH={self.DEVICE_JAR_PATH}",
+                    "app_process",
+                    "/",
+                    "com.genymobile.scrcpy.Server",
+                    self.SCRCPY_VERSION,
+                    "log_level=verbose",
+                    *(
+                        ["video=true", "video_codec=h264", "video_bit_rate=16000000", "max_size=0"]
+                        if self.frame_source is not None
+                        else ["video=false"]
+                    ),
+                    "audio=false",
+                    "control=true",
+                    "stay_awake=true",
+                    "power_off_on_close=false",
+                    "clipboard_autosync=false",
+                ],
+                # stdout=subprocess.DEVNULL,
+            )
+
+            if self.frame_source is not None:
+                # the server opens the video socket first, then the control socket
+                video_conn, _ = s.accept()
+                video_conn.settimeout(None)
+                self.frame_source.start(video_conn)
+            self.control_conn, _ = s.accept()
+            self.control_conn.settimeout(None)
+            self.control_conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def close(self):
+        """Close the sockets and stop the server. The reverse tunnel and the pushed jar are kept for the next session."""
+        if self.frame_source is not None:
+            self.frame_source.stop()
+        if self.control_conn is not None:
+            # half-close and wait for the server to hang up, so that queued messages are injected before it is stopped
+            try:
+                self.control_conn.shutdown(socket.SHUT_WR)
+                self.control_conn.settimeout(self.connect_timeout)
+                while self.control_conn.recv(4096):
+                    pass  # device messages (e.g. clipboard) are not used
+            except OSError:
+                pass
+            self.control_conn.close()
+            self.control_conn = None
+        if self.server_process is not None:
+            self.server_process.kill()
+            self.server_process.wait()
+            self.server_process = None
+            subprocess.call([self.adb_path, "shell", "am", "kill", "com.genymobile.scrcpy.Server"])
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
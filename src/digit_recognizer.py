@@ -0,0 +1,304 @@
+import hashlib
+import os
+from concurrent.futures import Executor, as_completed
+from pathlib import Path
+from typing import Literal, Sequence
+
+import cv2
+import numpy as np
+
+from instrumentation import count, traced
+from puzzle_cache import PuzzleCache
+
+
+class DigitRecognizer:
+    """
+    Recognizes single clue digits by matching them against the templates in digits/*.png.
+
+    Crops are white digits on a black background. Each crop is cut to its bounding box, scaled
+    to the template height and centered in a fixed size box, so that all crops of a board can
+    be compared with all templates in a single matrix product (normalized cross-correlation).
+    Crops scoring below min_score (e.g. a glyph drawn differently on another device), or
+    within min_margin of a second template, fall back to Tesseract if it is installed. With mode="tesseract" every crop goes to Tesseract.
+    Either way Tesseract is run once per batch: the crops are tiled into a single sheet and the
+    character boxes of the result are mapped back to their tiles.
+
+    With a cache, glyphs Tesseract has read before are not sent to it again. Glyphs are keyed by
+    their bitmap as laid out on the sheet, so a hit is exactly what Tesseract would have seen.
+    Identical glyphs within a batch are sent once.
+
+    Example:
+    >>> recognizer = DigitRecognizer()
+    >>> candidates = recognizer.recognize_candidates(digit_images)
+    """
+
+    HEIGHT = 18  # height of the bundled templates
+    WIDTH = 18
+
+    # There is no bundled 0 template: no 0 has been captured from a device yet. A 0 matches the 9 and 6 templates
+    # almost equally, so min_margin makes it uncertain, and an uncertain digit always has 0 as a candidate.
+    ZERO_CONFIDENCE = 0.5
+
+    # Tesseract sheet layout
+    SHEET_DIGIT_HEIGHT = 32
+    SHEET_TILE = 64
+    SHEET_TILES_PER_LINE = 24
+
+    def __init__(
+        self,
+        digits_path: Path | None = None,
+        min_score=0.8,
+        min_margin=0.1,
+        tesseract_fallback=True,
+        mode: Literal["template", "tesseract"] = "template",
+        executor: Executor | None = None,
+        sheet_workers: int | None = None,
+        cache: PuzzleCache | None = None,
+    ):
+        """
+        min_score, min_margin: a digit is certain if its best template scores at least min_score,
+            and at least min_margin more than the second best
+        executor: runs Tesseract sheets in parallel. Tesseract is a subprocess, so threads are enough.
+        sheet_workers: number of sheets a batch is split into, by default the CPU count
+        cache: persistent store of glyphs read by Tesseract
+        """
+        if digits_path is None:
+            digits_path = Path(__file__).parent.parent / "digits"
+
+        self.mode = mode
+        self.executor = executor
+        self.sheet_workers = sheet_workers if sheet_workers is not None else (os.cpu_count() or 1)
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self.tesseract_fallback = tesseract_fallback
+        self.cache = cache
+
+        values = []
+        templates = []
+        for path in sorted(digits_path.glob("*.png")):
+            image = cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+            if image is None:
+                raise Exception(f"Failed to load digit template {path}")
+            values.append(int(path.stem))
+            templates.append(self.normalize(image))
+
+        if not templates:
+            raise Exception(f"No digit templates found in {digits_path}")
+
+        self.values = np.array(values)
+        self.templates = np.stack(templates)  # (templates, HEIGHT * WIDTH)
+
+    @classmethod
+    def normalize(cls, digit: np.ndarray) -> np.ndarray:
+        """Cut a digit to its bounding box, scale it to the template height keeping its aspect ratio
+        and center it in a HEIGHT x WIDTH box. Returns a zero-mean, unit-length vector."""
+        box = np.zeros((cls.HEIGHT, cls.WIDTH), dtype=np.float32)
+
+        ys, xs = np.nonzero(digit)
+        if len(ys) > 0:
+            digit = digit[ys.min() : ys.max() + 1, xs.min() : xs.max() + 1]
+            h, w = digit.shape
+            w = max(1, min(cls.WIDTH, round(w * cls.HEIGHT / h)))
+            scaled = cv2.resize(digit, (w, cls.HEIGHT), interpolation=cv2.INTER_AREA)
+            left = (cls.WIDTH - w) // 2
+            box[:, left : left + w] = scaled > 127
+
+        vector = box.ravel()
+        vector -= vector.mean()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def classify(self, digits: Sequence[np.ndarray]) -> tuple[np.ndarray, np.ndarray]:
+        """Match all digits against all templates at once.
+
+        Returns:
+            The (digits, templates) score matrix and the template values of its columns.
+        """
+        if len(digits) == 0:
+            return np.zeros((0, len(self.values)), dtype=np.float32), self.values
+
+        vectors = np.stack([self.normalize(digit) for digit in digits])
+        return vectors @ self.templates.T, self.values
+
+    def recognize_candidates(self, digits: Sequence[np.ndarray], max_candidates=3) -> list[list[tuple[int, float]]]:
+        """Recognize digits, keeping the alternatives of the uncertain ones.
+
+        A certain digit (see min_score and min_margin) gets a single candidate. Any other digit gets the
+        Tesseract reading (with confidence min_score), the max_candidates best templates and 0, which has
+        no template (with confidence ZERO_CONFIDENCE).
+        In tesseract mode a digit Tesseract could not read gets every value with confidence 0.
+
+        Returns:
+            (value, confidence) candidates of each digit, most likely first.
+        """
+        count("ocr_digits", len(digits))
+        if self.mode == "tesseract":
+            return [
+                [(value, 1.0)] if value is not None else [(v, 0.0) for v in range(10)]
+                for value in self.tesseract_parallel(digits)
+            ]
+
+        scores, values = self.classify(digits)
+        order = np.argsort(-scores, axis=1)[:, : max(2, max_candidates)]
+        best = scores[np.arange(len(scores)), order[:, 0]]
+        certain = (best >= self.min_score) & (best - scores[np.arange(len(scores)), order[:, 1]] >= self.min_margin)
+        order = order[:, :max_candidates]
+
+        uncertain = [i for i in range(len(scores)) if not certain[i]]
+        fallback_of: dict[int, int | None] = {}
+        if self.tesseract_fallback and uncertain:
+            fallback_of = dict(zip(uncertain, self.tesseract_parallel([digits[i] for i in uncertain])))
+
+        candidates = []
+        for i, digit_scores in enumerate(scores):
+            if certain[i]:
+                candidates.append([(int(values[order[i, 0]]), float(digit_scores[order[i, 0]]))])
+                continue
+
+            digit_candidates: dict[int, float] = {}
+            if fallback_of.get(i) is not None:
+                digit_candidates[fallback_of[i]] = self.min_score
+            for b in order[i]:
+                digit_candidates.setdefault(int(values[b]), max(0.0, float(digit_scores[b])))
+            digit_candidates.setdefault(0, self.ZERO_CONFIDENCE)
+            candidates.append(sorted(digit_candidates.items(), key=lambda candidate: -candidate[1]))
+
+        return candidates
+
+    def tesseract_parallel(self, digits: Sequence[np.ndarray]) -> list[int | None]:
+        """tesseract_digits for the glyphs not in the cache, split into up to sheet_workers sheets run on the executor.
+        Results keep the input order."""
+        count("tesseract_digits", len(digits))
+        keys = [self.glyph_key(digit) for digit in digits]
+        known = self.cache.lookup_glyphs(keys) if self.cache is not None else {}
+        count("glyph_cache_hits", sum(key in known for key in keys))
+        count("glyph_cache_misses", sum(key not in known for key in keys))
+
+        # every distinct unknown glyph goes to Tesseract once
+        pending: dict[str, np.ndarray] = {}
+        for key, digit in zip(keys, digits):
+            if key not in known:
+                pending.setdefault(key, digit)
+
+        read = dict(zip(pending, self.__tesseract_batch(list(pending.values()))))
+        if self.cache is not None:
+            self.cache.store_glyphs({key: value for key, value in read.items() if value is not None})
+
+        known.update(read)
+        return [known[key] for key in keys]
+
+    def __tesseract_batch(self, digits: Sequence[np.ndarray]) -> list[int | None]:
+        if not digits:
+            return []
+        if self.executor is None or len(digits) <= self.SHEET_TILES_PER_LINE:
+            return self.tesseract_digits(digits)
+
+        from tqdm import tqdm
+
+        chunk = max(self.SHEET_TILES_PER_LINE, -(-len(digits) // self.sheet_workers))
+        futures = {
+            self.executor.submit(self.tesseract_digits, digits[start : start + chunk]): start
+            for start in range(0, len(digits), chunk)
+        }
+
+        results: list[int | None] = [None] * len(digits)
+        with tqdm(total=len(digits), desc="OCR", leave=False) as progress:
+            for future in as_completed(futures):
+                start = futures[future]
+                part = future.result()
+                results[start : start + len(part)] = part
+                progress.update(len(part))
+
+        return results
+
+    @classmethod
+    def sheet_glyph(cls, digit: np.ndarray) -> np.ndarray | None:
+        """A digit cut to its bounding box and scaled to SHEET_DIGIT_HEIGHT, as it is laid out on a sheet. None if it is empty."""
+        ys, xs = np.nonzero(digit)
+        if len(ys) == 0:
+            return None
+        digit = digit[ys.min() : ys.max() + 1, xs.min() : xs.max() + 1]
+        h, w = digit.shape
+        w = max(1, min(cls.SHEET_TILE // 2, round(w * cls.SHEET_DIGIT_HEIGHT / h)))
+        return cv2.resize(digit, (w, cls.SHEET_DIGIT_HEIGHT), interpolation=cv2.INTER_NEAREST)
+
+    @classmethod
+    def glyph_key(cls, digit: np.ndarray) -> str:
+        """Hash of the binarized sheet glyph of a digit, identical for pixel-identical digits of any position."""
+        glyph = cls.sheet_glyph(digit)
+        if glyph is None:
+            return "empty"
+        digest = hashlib.sha1(np.array(glyph.shape, dtype=np.int32).tobytes())
+        digest.update(np.packbits(glyph > 127).tobytes())
+        return digest.hexdigest()
+
+    @classmethod
+    def tile_sheet(cls, digits: Sequence[np.ndarray]) -> np.ndarray:
+        """Tile digits into a dark-on-white sheet, SHEET_TILES_PER_LINE tiles per line."""
+        lines = (len(digits) + cls.SHEET_TILES_PER_LINE - 1) // cls.SHEET_TILES_PER_LINE
+        sheet = np.full(
+            (lines * cls.SHEET_TILE, cls.SHEET_TILES_PER_LINE * cls.SHEET_TILE), 255, dtype=np.uint8
+        )
+
+        for i, digit in enumerate(digits):
+            scaled = cls.sheet_glyph(digit)
+            if scaled is None:
+                continue
+            w = scaled.shape[1]
+
+            line, column = divmod(i, cls.SHEET_TILES_PER_LINE)
+            top = line * cls.SHEET_TILE + (cls.SHEET_TILE - cls.SHEET_DIGIT_HEIGHT) // 2
+            left = column * cls.SHEET_TILE + (cls.SHEET_TILE - w) // 2
+            sheet[top : top + cls.SHEET_DIGIT_HEIGHT, left : left + w] = 255 - scaled
+
+        return sheet
+
+    @classmethod
+    @traced("tesseract")
+    def tesseract_digits(cls, digits: Sequence[np.ndarray]) -> list[int | None]:
+        """Recognize digits with a single Tesseract call per attempt.
+
+        Digits still unrecognized after the first pass are retried dilated, again as one sheet.
+        Returns None for digits that could not be recognized, or for all of them if Tesseract is not installed.
+        """
+        results: list[int | None] = [None] * len(digits)
+        try:
+            import pytesseract as tess
+        except ImportError:
+            return results
+
+        # dilated retry: thin digits are sometimes not recognized
+        kernel = np.ones((2, 2), np.uint8)
+        for dilate in (False, True):
+            pending = [i for i, value in enumerate(results) if value is None]
+            if not pending:
+                break
+
+            count("tesseract_calls")
+            sheet = cls.tile_sheet(
+                [cv2.dilate(digits[i], kernel, iterations=1) if dilate else digits[i] for i in pending]
+            )
+            try:
+                boxes = tess.image_to_boxes(sheet, config="--psm 6 digits", output_type=tess.Output.DICT)
+            except tess.TesseractNotFoundError:
+                return results
+
+            # one box per character, mapped to the tile under its center. Box coordinates start at the bottom.
+            read: dict[int, set[int]] = {}
+            for char, left, bottom, right, top in zip(
+                boxes["char"], boxes["left"], boxes["bottom"], boxes["right"], boxes["top"]
+            ):
+                if not char.isdigit():
+                    continue
+                line = int((sheet.shape[0] - (bottom + top) / 2) // cls.SHEET_TILE)
+                column = int((left + right) / 2 // cls.SHEET_TILE)
+                tile = line * cls.SHEET_TILES_PER_LINE + column
+                if 0 <= column < cls.SHEET_TILES_PER_LINE and 0 <= tile < len(pending):
+                    read.setdefault(tile, set()).add(int(char))
+
+            # a tile read as several different characters is left unrecognized
+            for tile, values in read.items():
+                if len(values) == 1:
+                    results[pending[tile]] = values.pop()
+
+        return results
@@ -0,0 +1,253 @@
+"""A stand-in for the scrcpy server on the device, to check the control channel and the video stream without a phone.
+
+Run from src/: python fake_scrcpy.py
+The video check needs PyAV, see requirements-video.txt, and is skipped without it.
+"""
+
+import os
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+
+from control_messages import (
+    ACTION_DOWN,
+    ACTION_MOVE,
+    ACTION_UP,
+    KEY,
+    TOUCH,
+    TYPE_INJECT_KEYCODE,
+    TYPE_INJECT_TOUCH_EVENT,
+)
+from frame_source import FrameSource
+
+
+def canned_video_stream(frames: list[np.ndarray], device_name="fake") -> bytes:
+    """
+    Encode BGR frames as the scrcpy server sends its video socket: the device name, the codec header,
+    then the H.264 config (SPS/PPS) in a config packet of its own, followed by one packet per frame.
+    Frame sides must be even. Needs PyAV.
+    """
+    from fractions import Fraction
+
+    import av
+
+    height, width = frames[0].shape[:2]
+    encoder = av.CodecContext.create("libx264", "w")
+    encoder.width = width
+    encoder.height = height
+    encoder.pix_fmt = "yuv420p"
+    encoder.time_base = Fraction(1, 60)
+    encoder.options = {"preset": "ultrafast", "tune": "zerolatency", "crf": "10"}
+
+    packets = []
+    for pts, image in enumerate(frames):
+        frame = av.VideoFrame.from_ndarray(image, format="bgr24")
+        frame.pts = pts
+        packets += [bytes(packet) for packet in encoder.encode(frame)]
+    packets += [bytes(packet) for packet in encoder.encode(None)]
+
+    # x264 puts the config in front of the first frame, the device encoder sends it on its own
+    first = packets[0]
+    nal_starts = [i for i in range(len(first) - 3) if first[i : i + 3] == b"\0\0\1"]
+    media_start = next(i for i in nal_starts if first[i + 3] & 0x1F not in (7, 8))  # not SPS or PPS
+    if media_start > 0 and first[media_start - 1] == 0:
+        media_start -= 1  # 4-byte start code
+    config, packets[0] = first[:media_start], first[media_start:]
+
+    stream = [
+        device_name.encode().ljust(FrameSource.DEVICE_NAME_LENGTH, b"\0"),
+        struct.pack(">III", FrameSource.CODEC_H264, width, height),
+        struct.pack(">QI", FrameSource.PACKET_FLAG_CONFIG, len(config)),
+        config,
+    ]
+    for pts, packet in enumerate(packets):
+        stream += [struct.pack(">QI", pts, len(packet)), packet]
+    return b"".join(stream)
+
+
+class FakeScrcpyServer:
+    """
+    Accepts a control connection on localhost and decodes every control message sent on it.
+
+    It can be passed to TouchHandler as its session: start() connects control_conn to the listener,
+    like DeviceSession does through the adb tunnel, and screen_size() reports the configured size.
+    Decoded messages are collected in `touches` (TOUCH fields) and `keys` (KEY fields), in order.
+    Given a frame_source, start() also plays `video`, a canned_video_stream, to it the way DeviceSession does.
+
+    Example:
+    >>> with FakeScrcpyServer() as server, TouchHandler(session=server) as touch_handler:
+    >>>   touch_handler.add_stroke([(100, 100), (100, 160)])
+    >>> server.wait_for(3)
+    """
+
+    def __init__(self, width=1080, height=2400, frame_source: FrameSource | None = None, video=b""):
+        self.width = width
+        self.height = height
+        self.frame_source = frame_source
+        self.video = video
+        self.touches: list[tuple] = []
+        self.keys: list[tuple] = []
+        self.error: Exception | None = None
+        self.control_conn: socket.socket | None = None
+        self.lock = threading.Lock()
+
+    def screen_size(self) -> tuple[int, int]:
+        return self.width, self.height
+
+    def start(self):
+        if self.control_conn is not None:
+            return
+
+        if self.frame_source is not None:
+            video_conn, self.video_device_conn = socket.socketpair()
+            threading.Thread(target=self.video_device_conn.sendall, args=(self.video,), daemon=True).start()
+            self.frame_source.start(video_conn)
+
+        self.listener = socket.create_server(("127.0.0.1", 0))
+        self.control_conn = socket.create_connection(self.listener.getsockname())
+        self.control_conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.device_conn, _ = self.listener.accept()
+        self.reader = threading.Thread(target=self.__read, name="fake-scrcpy", daemon=True)
+        self.reader.start()
+
+    def __recv_exactly(self, size: int) -> bytes | None:
+        data = b""
+        while len(data) < size:
+            chunk = self.device_conn.recv(size - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    def __read(self):
+        try:
+            while True:
+                message_type = self.__recv_exactly(1)
+                if message_type is None:
+                    return
+
+                if message_type[0] == TYPE_INJECT_TOUCH_EVENT:
+                    rest = self.__recv_exactly(TOUCH.size - 1)
+                    if rest is None:
+                        raise Exception("Connection closed inside a touch message")
+                    with self.lock:
+                        self.touches.append(TOUCH.unpack(message_type + rest))
+                elif message_type[0] == TYPE_INJECT_KEYCODE:
+                    rest = self.__recv_exactly(KEY.size - 1)
+                    if rest is None:
+                        raise Exception("Connection closed inside a key message")
+                    with self.lock:
+                        self.keys.append(KEY.unpack(message_type + rest))
+                else:
+                    raise Exception(f"Unknown control message type {message_type[0]}")
+        except Exception as e:
+            self.error = e
+
+    def wait_for(self, messages: int, timeout=5.0):
+        """Wait until at least `messages` touch and key messages have been decoded."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.error is not None:
+                raise self.error
+            with self.lock:
+                if len(self.touches) + len(self.keys) >= messages:
+                    return
+            time.sleep(0.01)
+        raise Exception(f"Received {len(self.touches) + len(self.keys)} of {messages} control messages")
+
+    def close(self):
+        if self.control_conn is None:
+            return
+        if self.frame_source is not None:
+            # hang up like a stopped server, which ends the decoder thread
+            self.frame_source.stop()
+            self.video_device_conn.close()
+        self.control_conn.close()
+        self.reader.join(timeout=5.0)
+        self.device_conn.close()
+        self.listener.close()
+        self.control_conn = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+def main():
+    """Send a tap, a stroke and a key through TouchHandler and check what the fake server decodes."""
+    from touch_handler import TouchHandler
+
+    with FakeScrcpyServer(1080, 2400) as server:
+        for _ in range(2):  # a second handler on the same session must work too
+            with TouchHandler(session=server, taps_per_second=1000.0, moves_per_second=1000.0) as touch_handler:
+                touch_handler.add_touch(10, 20)
+                touch_handler.add_stroke([(100, 200), (100, 232), (100, 264)])
+                touch_handler.add_key(4)  # AKEYCODE_BACK
+            # the socket object only knows its own timeout, the descriptor's O_NONBLOCK flag is what recv() obeys
+            if not os.get_blocking(server.control_conn.fileno()):
+                raise Exception("Control socket left non-blocking by the touch handler")
+
+        server.wait_for(2 * 8)
+
+    expected = [
+        (ACTION_DOWN, 10, 20),
+        (ACTION_UP, 10, 20),
+        (ACTION_DOWN, 100, 200),
+        (ACTION_MOVE, 100, 232),
+        (ACTION_MOVE, 100, 264),
+        (ACTION_UP, 100, 264),
+    ] * 2
+    received = [(action, x, y) for _, action, _, x, y, *_ in server.touches]
+    if received != expected:
+        raise Exception(f"Expected touches {expected}, received {received}")
+    if any((width, height) != (1080, 2400) for *_, width, height, _, _, _ in server.touches):
+        raise Exception("Touches carry the wrong screen size")
+    if [(action, keycode) for _, action, keycode, _, _ in server.keys] != [(ACTION_DOWN, 4), (ACTION_UP, 4)] * 2:
+        raise Exception(f"Unexpected keys {server.keys}")
+
+    print(f"OK: {len(server.touches)} touches and {len(server.keys)} keys decoded")
+
+    try:
+        import av  # noqa: F401
+    except ImportError:
+        print("Skipped the video check, PyAV is not installed")
+        return
+    check_video()
+
+
+def check_video():
+    """Stream a board through FrameSource and read its clues from the decoded frames."""
+    from pathlib import Path
+
+    import cv2
+
+    from board_reader import BoardReader
+    from solver import Solver
+
+    corpus = Path(__file__).parent.parent / "corpus"
+    board = cv2.imread(str(corpus / "synthetic_30x30.png"))
+    blank = np.zeros_like(board)
+    frame_source = FrameSource()
+    with FakeScrcpyServer(board.shape[1], board.shape[0], frame_source, canned_video_stream([blank, board])):
+        frame = frame_source.latest_frame()
+        while frame.max() == 0:  # the blank frame before the board
+            frame = frame_source.next_frame()
+        if (frame_source.width, frame_source.height) != (board.shape[1], board.shape[0]):
+            raise Exception(f"Stream header says {frame_source.width}x{frame_source.height}")
+        with BoardReader(frame_source=frame_source) as board_reader:
+            rows, cols = board_reader.run_candidates()
+
+    expected = Solver.read_problem(corpus / "synthetic_30x30.nin")
+    if Solver().resolve_clues(rows, cols) != expected:
+        raise Exception("Clues read from the video stream differ from the board")
+    print(f"OK: {frame.shape[1]}x{frame.shape[0]} frames decoded, clues read from the stream")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import socket
+import struct
+import threading
+
+import numpy as np
+
+
+class FrameSource:
+    """
+    FrameSource decodes the scrcpy video stream in a background thread and keeps the latest frame.
+    It is fed the video socket by DeviceSession, and read by BoardReader instead of taking screenshots.
+    Decoding needs PyAV (requirements-video.txt), which is only imported when the stream starts.
+    `python program.py play --video` uses it, fake_scrcpy.py checks it against a canned stream.
+
+    Example:
+    >>> frame_source = FrameSource()
+    >>> with DeviceSession(frame_source=frame_source) as session:
+    >>>   row_candidates, col_candidates = BoardReader(frame_source=frame_source).run_candidates()
+    >>>   with TouchHandler(session=session) as touch_handler:
+    >>>     touch_handler.add_touch(100, 100)
+    """
+
+    DEVICE_NAME_LENGTH = 64
+    CODEC_H264 = 0x68323634  # "h264"
+    PACKET_FLAG_CONFIG = 1 << 63
+
+    def __init__(self):
+        self.width = None
+        self.height = None
+
+        self.__frame = None
+        self.__frame_index = 0
+        self.__error = None
+        self.__condition = threading.Condition()
+        self.__running = False
+        self.__thread = None
+
+    @staticmethod
+    def __recv_exactly(conn: socket.socket, size: int) -> bytes:
+        buffer = bytearray(size)
+        view = memoryview(buffer)
+        received = 0
+        while received < size:
+            n = conn.recv_into(view[received:], size - received)
+            if n == 0:
+                raise EOFError("Video stream closed")
+            received += n
+        return bytes(buffer)
+
+    def __run_decoder(self, video_conn: socket.socket, send_device_meta: bool):
+        try:
+            import av
+
+            with video_conn:
+                if send_device_meta:
+                    self.__recv_exactly(video_conn, self.DEVICE_NAME_LENGTH)
+
+                codec_id, self.width, self.height = struct.unpack(">III", self.__recv_exactly(video_conn, 12))
+                if codec_id != self.CODEC_H264:
+                    raise Exception(f"Unsupported video codec: {codec_id:#x}")
+
+                codec = av.CodecContext.create("h264", "r")
+                config = b""
+                while self.__running:
+                    pts_and_flags, size = struct.unpack(">QI", self.__recv_exactly(video_conn, 12))
+                    data = self.__recv_exactly(video_conn, size)
+
+                    if pts_and_flags & self.PACKET_FLAG_CONFIG:
+                        # SPS/PPS, the decoder wants it in front of the next media packet
+                        config = data
+                        continue
+
+                    for frame in codec.decode(av.Packet(config + data)):
+                        image = frame.to_ndarray(format="bgr24")
+                        with self.__condition:
+                            self.__frame = image
+                            self.__frame_index += 1
+                            self.__condition.notify_all()
+                    config = b""
+        except Exception as e:
+            if self.__running:
+                with self.__condition:
+                    self.__error = e
+                    self.__condition.notify_all()
+
+    def start(self, video_conn: socket.socket, send_device_meta=True):
+        """Start decoding the video socket of a scrcpy server in a background thread."""
+        self.__running = True
+        self.__thread = threading.Thread(
+            target=self.__run_decoder, args=(video_conn, send_device_meta), daemon=True
+        )
+        self.__thread.start()
+
+    def stop(self):
+        self.__running = False
+        with self.__condition:
+            self.__condition.notify_all()
+
+    def __wait(self, predicate, timeout: float | None) -> np.ndarray:
+        with self.__condition:
+            if not self.__condition.wait_for(lambda: predicate() or self.__error is not None, timeout):
+                raise TimeoutError("No video frame received")
+            if self.__error is not None:
+                raise Exception("Video stream failed") from self.__error
+            return self.__frame
+
+    def latest_frame(self, timeout: float | None = 5.0) -> np.ndarray:
+        """The most recent decoded frame (BGR). Waits for the first frame if none has arrived yet."""
+        return self.__wait(lambda: self.__frame is not None, timeout)
+
+    def next_frame(self, timeout: float | None = 5.0) -> np.ndarray:
+        """The first frame decoded after this call, e.g. to check the board after input."""
+        with self.__condition:
+            index = self.__frame_index
+        return self.__wait(lambda: self.__frame_index > index, timeout)
@@ -0,0 +1,74 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class BoardGeometry:
+    """
+    Where the board is on screen: the pixel bounds of the cell area, the grid size and the screen resolution.
+
+    Rows and columns are counted separately, so boards need not be square. Cells may be slightly
+    non-square on screen too, the horizontal and vertical pitch are kept apart.
+
+    Example:
+    >>> geometry = BoardGeometry(left=60, top=900, right=1020, bottom=1860, rows=30, cols=30, screen_width=1080, screen_height=2400)
+    >>> x, y = geometry.cell_to_coordinates(0, 0)
+    """
+
+    left: int
+    top: int
+    right: int
+    bottom: int
+    rows: int
+    cols: int
+    screen_width: int
+    screen_height: int
+
+    @property
+    def pitch_x(self) -> float:
+        """Cell width in pixels."""
+        return (self.right - self.left) / self.cols
+
+    @property
+    def pitch_y(self) -> float:
+        """Cell height in pixels."""
+        return (self.bottom - self.top) / self.rows
+
+    def cell_to_coordinates(self, left: int, top: int) -> tuple[int, int]:
+        """Screen coordinates of the center of cell (left, top)."""
+        x = int(self.left + self.pitch_x * (left + 0.5))
+        y = int(self.top + self.pitch_y * (top + 0.5))
+        return x, y
+
+    def scaled_to(self, screen_width: int, screen_height: int) -> "BoardGeometry":
+        """The same board on a screen of another resolution, e.g. the touch coordinate space of the device
+        when the board was read from a downscaled video frame.
+
+        Raises:
+            Exception: the aspect ratios differ, e.g. the screen was rotated or the image is cropped
+        """
+        scale_x = screen_width / self.screen_width
+        scale_y = screen_height / self.screen_height
+        if abs(scale_x - scale_y) > 0.01 * max(scale_x, scale_y):
+            raise Exception(
+                f"Screen is {screen_width}x{screen_height} but the board was read from a "
+                f"{self.screen_width}x{self.screen_height} image"
+            )
+
+        return BoardGeometry(
+            left=round(self.left * scale_x),
+            top=round(self.top * scale_y),
+            right=round(self.right * scale_x),
+            bottom=round(self.bottom * scale_y),
+            rows=self.rows,
+            cols=self.cols,
+            screen_width=screen_width,
+            screen_height=screen_height,
+        )
+
+    def column_of(self, x: float) -> int:
+        """Column of a horizontal pixel position, relative to the left edge of the board."""
+        return min(self.cols - 1, max(0, int(x / self.pitch_x)))
+
+    def row_of(self, y: float) -> int:
+        """Row of a vertical pixel position, relative to the top edge of the board."""
+        return min(self.rows - 1, max(0, int(y / self.pitch_y)))
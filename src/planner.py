@@ -0,0 +1,327 @@
+import argparse
+from dataclasses import dataclass
+from math import sqrt
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+
+from geometry import BoardGeometry
+from solver import Solver
+
+Cell = tuple[int, int]  # (x, y) board coordinates
+Stroke = list[Cell]  # cells in the order the finger passes them, a single cell is a tap
+
+
+def row_runs(solution: np.ndarray) -> list[Stroke]:
+    """Maximal runs of filled cells in each row, left to right."""
+    runs: list[Stroke] = []
+    for y, row in enumerate(solution):
+        x = 0
+        while x < len(row):
+            if row[x]:
+                start = x
+                while x < len(row) and row[x]:
+                    x += 1
+                runs.append([(i, y) for i in range(start, x)])
+            else:
+                x += 1
+    return runs
+
+
+def find_runs(solution: np.ndarray) -> tuple[list[Stroke], list[Stroke]]:
+    """Maximal horizontal and vertical runs of filled cells."""
+    horizontal = row_runs(solution)
+    vertical = [[(x, y) for y, x in run] for run in row_runs(solution.T)]
+    return horizontal, vertical
+
+
+def augment(root: int, edges: list[list[int]], match_h: list[int], match_v: list[int]) -> bool:
+    """Find an augmenting path from an unmatched left vertex and flip it. Iterative DFS, runs can be many."""
+    visited: set[int] = set()
+    stack = [(root, iter(edges[root]))]
+    path: list[tuple[int, int]] = []  # (h, v) edges leading to the top of the stack
+    while stack:
+        h, neighbours = stack[-1]
+        for v in neighbours:
+            if v in visited:
+                continue
+            visited.add(v)
+            if match_v[v] == -1:
+                for ph, pv in path + [(h, v)]:
+                    match_h[ph], match_v[pv] = pv, ph
+                return True
+            path.append((h, v))
+            stack.append((match_v[v], iter(edges[match_v[v]])))
+            break
+        else:
+            stack.pop()
+            if path:
+                path.pop()
+    return False
+
+
+def vertex_cover(edges: list[list[int]], vertical_count: int) -> tuple[list[int], list[int]]:
+    """Minimum vertex cover of a bipartite graph, from a maximum matching with König's theorem.
+
+    edges: the vertical vertices adjacent to each horizontal vertex
+
+    Returns:
+        The horizontal and the vertical vertices of the cover.
+    """
+    # maximum matching
+    match_h = [-1] * len(edges)
+    match_v = [-1] * vertical_count
+    for root in range(len(edges)):
+        augment(root, edges, match_h, match_v)
+
+    # König: walk alternating paths from unmatched horizontal vertices
+    reached_h = {h for h in range(len(edges)) if match_h[h] == -1}
+    reached_v: set[int] = set()
+    frontier = list(reached_h)
+    while frontier:
+        h = frontier.pop()
+        for v in edges[h]:
+            if v not in reached_v:
+                reached_v.add(v)
+                if match_v[v] != -1 and match_v[v] not in reached_h:
+                    reached_h.add(match_v[v])
+                    frontier.append(match_v[v])
+
+    return [h for h in range(len(edges)) if h not in reached_h], sorted(reached_v)
+
+
+def minimum_cover(solution: np.ndarray) -> list[Stroke]:
+    """A minimum set of maximal horizontal and vertical runs covering every filled cell.
+
+    Every filled cell lies on exactly one maximal horizontal run and one maximal vertical run, so choosing
+    the fewest runs that cover all cells is a minimum vertex cover of the bipartite run graph (cells are
+    edges).
+    """
+    horizontal, vertical = find_runs(solution)
+
+    vertical_of = {cell: j for j, run in enumerate(vertical) for cell in run}
+    edges = [[vertical_of[cell] for cell in run] for run in horizontal]
+
+    cover_h, cover_v = vertex_cover(edges, len(vertical))
+    return [horizontal[h] for h in cover_h] + [vertical[v] for v in cover_v]
+
+
+def known_cover(solution: np.ndarray, rows: set[int], cols: set[int], filled: set[Cell]) -> list[Stroke]:
+    """Strokes filling the cells of the completed rows and columns that are not in `filled` yet, row by row.
+
+    Only the completed lines of solution are read, e.g. the lines yielded so far by Solver.iter_solve.
+    Horizontal runs come from completed rows and vertical runs from completed columns. A cell whose crossing
+    line is not complete can only be filled by the run of its own line, so those runs are taken first, the
+    cells left are covered as in minimum_cover. With every line complete this is plan_strokes minus `filled`.
+    Strokes are trimmed against `filled`, which is updated.
+    """
+    horizontal = [run for run in row_runs(solution) if run[0][1] in rows]
+    vertical = [[(x, y) for y, x in run] for run in row_runs(solution.T) if run[0][1] in cols]
+    horizontal = [run for run in horizontal if not filled.issuperset(run)]
+    vertical = [run for run in vertical if not filled.issuperset(run)]
+
+    forced = [run for run in horizontal if any(x not in cols and (x, y) not in filled for x, y in run)]
+    forced += [run for run in vertical if any(y not in rows and (x, y) not in filled for x, y in run)]
+    covered = {cell for run in forced for cell in run} | filled
+
+    # cells left lie on a horizontal and a vertical run
+    horizontal = [run for run in horizontal if not covered.issuperset(run)]
+    vertical = [run for run in vertical if not covered.issuperset(run)]
+    vertical_of = {cell: j for j, run in enumerate(vertical) for cell in run}
+    edges = [[vertical_of[cell] for cell in run if cell not in covered] for run in horizontal]
+
+    cover_h, cover_v = vertex_cover(edges, len(vertical))
+    cover = forced + [horizontal[h] for h in cover_h] + [vertical[v] for v in cover_v]
+    cover.sort(key=lambda run: (run[0][1], run[0][0]))
+    return trim_strokes(cover, filled)
+
+
+def greedy_cover(solution: np.ndarray) -> list[Stroke]:
+    """Greedy set cover: repeatedly take the run covering the most cells not covered yet."""
+    horizontal, vertical = find_runs(solution)
+    runs = horizontal + vertical
+    uncovered = {cell for run in horizontal for cell in run}
+
+    cover = []
+    while uncovered:
+        best = max(runs, key=lambda run: sum(cell in uncovered for cell in run))
+        cover.append(best)
+        uncovered.difference_update(best)
+    return cover
+
+
+def plan_strokes(solution: np.ndarray) -> list[Stroke]:
+    """Plan a minimum set of horizontal and vertical strokes filling every filled cell of the solution, row by row.
+
+    Strokes may cross cells filled by an earlier stroke. The game keeps filled cells filled while dragging,
+    as long as the drag starts on an empty cell, so strokes are trimmed to start and end on empty cells.
+    """
+    cover = minimum_cover(solution)
+    cover.sort(key=lambda run: (run[0][1], run[0][0]))
+    return trim_strokes(cover)
+
+
+def trim_strokes(strokes: list[Stroke], filled: set[Cell] | None = None) -> list[Stroke]:
+    """Drop cells already filled by earlier strokes from both ends of each stroke, and strokes left empty.
+
+    filled: cells filled before these strokes, updated in place if given
+    """
+    if filled is None:
+        filled = set()
+    trimmed = []
+    for stroke in strokes:
+        start, end = 0, len(stroke)
+        while start < end and stroke[start] in filled:
+            start += 1
+        while end > start and stroke[end - 1] in filled:
+            end -= 1
+        if start < end:
+            trimmed.append(stroke[start:end])
+            filled.update(stroke[start:end])
+    return trimmed
+
+
+def order_nearest(strokes: list[Stroke]) -> list[Stroke]:
+    """Nearest neighbour tour over stroke endpoints, starting top left. Strokes may be reversed."""
+    remaining = list(strokes)
+    ordered: list[Stroke] = []
+    position = (0, 0)
+    while remaining:
+        best_index, best_reversed, best_distance = 0, False, None
+        for i, stroke in enumerate(remaining):
+            for is_reversed, start in ((False, stroke[0]), (True, stroke[-1])):
+                distance = abs(start[0] - position[0]) + abs(start[1] - position[1])
+                if best_distance is None or distance < best_distance:
+                    best_index, best_reversed, best_distance = i, is_reversed, distance
+        stroke = remaining.pop(best_index)
+        if best_reversed:
+            stroke = stroke[::-1]
+        ordered.append(stroke)
+        position = stroke[-1]
+    return ordered
+
+
+def order_two_opt(strokes: list[Stroke], max_rounds=20) -> list[Stroke]:
+    """Improve a nearest neighbour order with 2-opt moves on the travel between stroke ends and starts.
+
+    Reversing a segment of the tour also reverses the direction of every stroke in it.
+    """
+    tour = order_nearest(strokes)
+
+    def gap(a: Cell, b: Cell) -> int:
+        return abs(a[0] - b[0]) + abs(a[1] - b[1])
+
+    for _ in range(max_rounds):
+        improved = False
+        for i in range(len(tour) - 1):
+            for j in range(i + 2, len(tour) + 1):
+                # reverse tour[i:j]: travel into tour[i] and out of tour[j - 1] changes
+                before = tour[i - 1][-1] if i > 0 else (0, 0)
+                current = gap(before, tour[i][0])
+                candidate = gap(before, tour[j - 1][-1])
+                if j < len(tour):
+                    current += gap(tour[j - 1][-1], tour[j][0])
+                    candidate += gap(tour[i][0], tour[j][0])
+                if candidate < current:
+                    tour[i:j] = [stroke[::-1] for stroke in reversed(tour[i:j])]
+                    improved = True
+        if not improved:
+            break
+
+    return tour
+
+
+@dataclass
+class InputSchedule:
+    strategy: str
+    gestures: list[list[tuple[int, int]]]  # screen points per gesture, as passed to TouchHandler.add_stroke
+    messages: int  # control messages sent
+    estimated_seconds: float
+
+
+STRATEGIES = ("taps", "strokes", "greedy_nearest", "strokes_nearest", "strokes_two_opt")
+
+
+def build_schedule(
+    solution: np.ndarray,
+    cell_to_coordinates: Callable[[int, int], tuple[int, int]],
+    strategy="strokes",
+    taps_per_second=20.0,
+    moves_per_second=60.0,
+    travel_pixels_per_second: float | None = None,
+) -> InputSchedule:
+    """Plan the input for a solution and estimate how long TouchHandler takes to send it.
+
+    The estimate follows TouchHandler's pacing: a tap takes 1 / taps_per_second, a stroke through n cells
+    takes (n - 1) / moves_per_second plus one tap time for the release. Injected touches jump between
+    gestures, travel is only counted if travel_pixels_per_second is given.
+
+    Args:
+        cell_to_coordinates: maps board (x, y) to screen coordinates, e.g. BoardGeometry.cell_to_coordinates
+    """
+    if strategy == "taps":
+        strokes = [[(int(x), int(y))] for y, x in zip(*np.nonzero(solution))]
+    elif strategy == "strokes":
+        strokes = plan_strokes(solution)
+    elif strategy == "greedy_nearest":
+        strokes = trim_strokes(order_nearest(greedy_cover(solution)))
+    elif strategy == "strokes_nearest":
+        strokes = trim_strokes(order_nearest(minimum_cover(solution)))
+    elif strategy == "strokes_two_opt":
+        strokes = trim_strokes(order_two_opt(minimum_cover(solution)))
+    else:
+        raise Exception(f"Unknown strategy: {strategy}")
+
+    gestures = [[cell_to_coordinates(x, y) for x, y in stroke] for stroke in strokes]
+
+    seconds = 0.0
+    messages = 0
+    position = None
+    for gesture in gestures:
+        seconds += (len(gesture) - 1) / moves_per_second + 1.0 / taps_per_second
+        messages += len(gesture) + 1
+        if travel_pixels_per_second is not None and position is not None:
+            seconds += sqrt((gesture[0][0] - position[0]) ** 2 + (gesture[0][1] - position[1]) ** 2) / travel_pixels_per_second
+        position = gesture[-1]
+
+    return InputSchedule(strategy=strategy, gestures=gestures, messages=messages, estimated_seconds=seconds)
+
+
+def compare_strategies(solution: np.ndarray, cell_to_coordinates, **kwargs) -> list[InputSchedule]:
+    """Build a schedule with every strategy, fastest first."""
+    schedules = [build_schedule(solution, cell_to_coordinates, strategy, **kwargs) for strategy in STRATEGIES]
+    return sorted(schedules, key=lambda schedule: schedule.estimated_seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare input strategies for a .nin puzzle offline.")
+    parser.add_argument("problem", type=Path, help=".nin problem file")
+    parser.add_argument("--pitch", type=float, default=32.0, help="cell pitch in pixels")
+    parser.add_argument("--taps-per-second", type=float, default=20.0)
+    parser.add_argument("--moves-per-second", type=float, default=60.0)
+    parser.add_argument("--travel-pixels-per-second", type=float, default=None)
+    args = parser.parse_args()
+
+    solution = Solver().solve(args.problem)
+
+    rows, cols = solution.shape
+    width, height = round(args.pitch * cols), round(args.pitch * rows)
+    geometry = BoardGeometry(0, 0, width, height, rows, cols, screen_width=width, screen_height=height)
+
+    schedules = compare_strategies(
+        solution,
+        geometry.cell_to_coordinates,
+        taps_per_second=args.taps_per_second,
+        moves_per_second=args.moves_per_second,
+        travel_pixels_per_second=args.travel_pixels_per_second,
+    )
+    for schedule in schedules:
+        print(
+            f"{schedule.strategy:>16}: {len(schedule.gestures):4} gestures, "
+            f"{schedule.messages:5} messages, {schedule.estimated_seconds:7.2f} s"
+        )
+
+
+if __name__ == "__main__":
+    main()
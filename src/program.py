@@ -1,30 +1,298 @@
+"""Command line entry point of the picross bot.
+
+    python program.py play                   read the board on the device, solve it and fill it in (the default)
+    python program.py shot.png               play on a saved screenshot instead of the device screen
+    python program.py play --video           read the board from the scrcpy video stream, faster than a screenshot
+    python program.py play --boards 5        play several boards on one device session
+    python program.py read -o problem.nin    only read the clues of the board
+    python program.py solve problem.nin      only solve a puzzle file
+    python program.py batch puzzles/ -j 4    solve a directory of puzzle files, see batch.py
+
+Heavy dependencies (OpenCV, the OCR, the device connection) are imported by the commands that use them,
+so solving a file does not pay for them. The time until a command is ready to run is checked against
+--startup-budget.
+"""
+
+import argparse
+import sys
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from pathlib import Path
-from time import sleep
-
-from board_reader import BoardReader
-from solver import Solver
-from touch_handler import TouchHandler
-
-board_reader = BoardReader()
-rows, cols = board_reader.run()
-temp_path = Path(__file__).parent / "temp"
-temp_path.mkdir(exist_ok=True)
-problem_path = temp_path / "problem.nin"
-board_reader.print_to_file(problem_path, rows, cols)
-
-solver = Solver()
-solution = solver.solve(problem_path, len(rows))
-
-with TouchHandler() as touch_handler:
-    for y, row in enumerate(solution):
-        for x, is_checked in enumerate(row):
-            if is_checked:
-                x_coord, y_coord = board_reader.cell_to_coordinates_30(x, y)
-                touch_handler.add_touch(x_coord, y_coord)
-                sleep(0.15)
-                print("#", end="", flush=True)
-            else:
-                print(".", end="", flush=True)
-        print("")
-
-print("Puzzle solved")
+
+_start = time.perf_counter()
+
+import instrumentation
+
+temp_path = Path(__file__).parent.parent / "temp"
+
+
+def read_clues(args, cache=None, frame_source=None):
+    """Read the board, letting the solver settle uncertain digits. A manual fix is only needed if several readings are solvable."""
+    from board_reader import BoardReader
+    from solver import AmbiguousClues, Solver
+
+    ready(args)
+    with BoardReader(cache=cache, frame_source=frame_source, debug_images=args.debug_images) as board_reader:
+        row_candidates, col_candidates = board_reader.run_candidates(args.screenshot)
+
+    problem_path = args.output if args.output is not None else temp_path / "problem.nin"
+    problem_path.parent.mkdir(parents=True, exist_ok=True)
+    if args.save_screenshot is not None:
+        board_reader.save_image(board_reader.IMAGE, args.save_screenshot)
+    solver = Solver()
+    try:
+        rows, cols = solver.resolve_clues(row_candidates, col_candidates)
+        board_reader.print_to_file(problem_path, rows, cols)
+    except AmbiguousClues as e:
+        print(e)
+        for rows, cols in e.puzzles:
+            print(f"  rows {rows}")
+            print(f"  cols {cols}")
+        board_reader.print_to_file(
+            problem_path, board_reader.most_likely(row_candidates), board_reader.most_likely(col_candidates)
+        )
+        print(f"Fix {problem_path} and press enter...")
+        input()
+        rows, cols = solver.read_problem(problem_path)
+
+    if args.save_screenshot is not None:
+        board_reader.print_to_file(args.save_screenshot.with_suffix(".nin"), rows, cols)
+
+    return board_reader, solver, rows, cols
+
+
+def print_solution(solution):
+    for row in solution:
+        print("".join("#" if is_checked else "." for is_checked in row))
+
+
+def read(args):
+    _, _, rows, cols = read_clues(args)
+    print(f"{len(rows)}x{len(cols)} board written to {args.output or temp_path / 'problem.nin'}")
+
+
+def solve(args):
+    from solver import Solver
+
+    ready(args)
+    print_solution(Solver().solve(args.problem))
+
+
+def play(args):
+    from device_session import DeviceSession
+    from puzzle_cache import PuzzleCache
+
+    frame_source = None
+    if args.video:
+        from frame_source import FrameSource
+
+        frame_source = FrameSource()
+
+    # boards and puzzles seen before skip OCR and solving
+    cache = PuzzleCache() if args.cache else None
+    # Starting the session takes seconds of adb calls, more than reading a cached board, so it runs meanwhile.
+    # With --video the board is read from the session's video stream, so it has to be started first.
+    session = DeviceSession(frame_source=frame_source)
+
+    def start_session() -> tuple[int, int]:
+        session.start()
+        return session.screen_size()
+
+    with ThreadPoolExecutor(1, thread_name_prefix="session") as executor:
+        session_started = executor.submit(start_session)
+        try:
+            if frame_source is not None:
+                session_started.result()
+            for board in range(args.boards):
+                if board > 0:
+                    input("Open the next board and press enter...")
+                play_board(args, cache, session, session_started, frame_source)
+        finally:
+            wait([session_started])
+            session.close()
+            if cache is not None:
+                cache.close()
+
+
+def play_board(args, cache, session, session_started: Future, frame_source):
+    """Read, solve and fill in one board, on the session once session_started gives its screen size."""
+    import numpy as np
+
+    from planner import build_schedule, known_cover
+    from touch_handler import TouchHandler
+
+    board_reader, solver, rows, cols = read_clues(args, cache, frame_source)
+    geometry = board_reader.geometry
+
+    height, width = len(rows), len(cols)
+    cached_solution = cache.lookup_solution(rows, cols) if cache is not None else None
+    solution = np.zeros((height, width), dtype=bool) if cached_solution is None else cached_solution
+    filled: set[tuple[int, int]] = set()  # cells already sent, so that later strokes do not tap them again
+    gestures = 0
+
+    with instrumentation.span("wait_for_session"):
+        screen_width, screen_height = session_started.result()
+    with TouchHandler(screen_width, screen_height, session=session) as touch_handler:
+        # cell coordinates come from the image, touches are in the device's screen coordinates
+        geometry = geometry.scaled_to(touch_handler.width, touch_handler.height)
+
+        def send(strokes):
+            nonlocal gestures
+            if strokes:
+                touch_handler.add_strokes(
+                    [[geometry.cell_to_coordinates(x, y) for x, y in stroke] for stroke in strokes]
+                )
+                touch_handler.flush()
+                gestures += len(strokes)
+
+        if cached_solution is not None:
+            schedule = build_schedule(solution, geometry.cell_to_coordinates)
+            touch_handler.add_strokes(schedule.gestures)
+            gestures = len(schedule.gestures)
+        else:
+            # Input starts with the first line solved, while the rest of the board is still being solved.
+            # Lines completed while the sender is busy are collected and planned together once it is idle,
+            # so most of the board gets the minimum cover of plan_strokes instead of one stroke per run.
+            # Lines buffered when a long search starts wait for it, which only happens on hard boards.
+            done_rows: set[int] = set()
+            done_cols: set[int] = set()
+            for kind, index, mask in solver.iter_solve(rows, cols):
+                if kind == "row":
+                    solution[index] = [(mask >> x) & 1 for x in range(width)]
+                    done_rows.add(index)
+                else:
+                    solution[:, index] = [(mask >> y) & 1 for y in range(height)]
+                    done_cols.add(index)
+                if not touch_handler.busy():
+                    send(known_cover(solution, done_rows, done_cols, filled))
+
+            # every row is yielded, so the whole board is known now
+            send(known_cover(solution, set(range(height)), set(range(width)), filled))
+
+    if cache is not None:
+        cache.store(rows, cols, solution, board_reader.board_key)
+
+    print_solution(solution)
+    print(f"{gestures} gestures")
+    print("Puzzle solved")
+
+
+def solve_batch(args):
+    import batch
+
+    ready(args)
+    batch.main(args.arguments)
+
+
+def ready(args):
+    """Called by each command once its imports are done: checks the startup time against the budget."""
+    startup = time.perf_counter() - _start
+    if args.startup_budget is not None and startup > args.startup_budget:
+        print(f"Warning: startup took {startup:.3f} s, over the {args.startup_budget} s budget", file=sys.stderr)
+    elif args.verbose:
+        print(f"Ready in {startup:.3f} s", file=sys.stderr)
+
+
+COMMANDS = ("play", "read", "solve", "batch")
+GLOBAL_OPTIONS_WITH_VALUE = ("--trace", "--startup-budget")
+
+
+def with_default_command(argv: list[str]) -> list[str]:
+    """Insert play before the first argument that is neither a global option nor a command, e.g. a screenshot."""
+    i = 0
+    while i < len(argv):
+        argument = argv[i]
+        if argument in COMMANDS or argument in ("-h", "--help"):
+            return argv
+        if argument in GLOBAL_OPTIONS_WITH_VALUE:
+            i += 2
+        elif argument.startswith("--") and argument.split("=", 1)[0] in GLOBAL_OPTIONS_WITH_VALUE:
+            i += 1
+        elif argument in ("-v", "--verbose"):
+            i += 1
+        else:
+            break
+    return [*argv[:i], "play", *argv[i:]]
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Solve picross boards on an Android device.")
+    parser.add_argument("--trace", type=Path, default=None, help="record a Chrome trace of the run to this file")
+    parser.add_argument(
+        "--startup-budget",
+        type=float,
+        default=1.0,
+        help="warn if a command takes longer than this many seconds to be ready (default: 1)",
+    )
+    parser.add_argument("-v", "--verbose", action="store_true", help="print the startup time")
+    commands = parser.add_subparsers(dest="command")
+
+    def add_reader_arguments(command):
+        # a saved screenshot can be replayed instead of capturing the device
+        command.add_argument("--screenshot", type=Path, default=None, help="read this screenshot instead of the device")
+        command.add_argument("screenshot_path", type=Path, nargs="?", default=None, help="same as --screenshot")
+        command.add_argument(
+            "-o", "--output", type=Path, default=None, help="write the clues here (default: temp/problem.nin)"
+        )
+        command.add_argument(
+            "--save-screenshot",
+            type=Path,
+            default=None,
+            help="save the board as this .png and its clues next to it as a .nin, to record a benchmark corpus. "
+            "Check the clues by hand before adding them to the corpus.",
+        )
+        command.add_argument(
+            "--debug-images", action="store_true", help="save the intermediate images of the reader to temp/"
+        )
+
+    play_command = commands.add_parser("play", help="read, solve and fill in the board on the device")
+    add_reader_arguments(play_command)
+    play_command.add_argument(
+        "--no-cache", dest="cache", action="store_false", help="do not use or update the board and solution cache"
+    )
+    play_command.add_argument(
+        "--video",
+        action="store_true",
+        help="read the board from the scrcpy video stream instead of an adb screenshot (needs PyAV, see "
+        "requirements-video.txt)",
+    )
+    play_command.add_argument(
+        "--boards",
+        type=int,
+        default=1,
+        help="play this many boards in a row on one device session, waiting for enter between them (default: 1)",
+    )
+    play_command.set_defaults(run=play)
+
+    read_command = commands.add_parser("read", help="read the clues of the board into a .nin file")
+    add_reader_arguments(read_command)
+    read_command.set_defaults(run=read)
+
+    solve_command = commands.add_parser("solve", help="solve a .nin file")
+    solve_command.add_argument("problem", type=Path)
+    solve_command.set_defaults(run=solve)
+
+    batch_command = commands.add_parser("batch", help="solve many .nin files in parallel, see batch.py -h")
+    batch_command.add_argument("arguments", nargs=argparse.REMAINDER)
+    batch_command.set_defaults(run=solve_batch)
+
+    args = parser.parse_args(with_default_command(argv if argv is not None else sys.argv[1:]))
+    if getattr(args, "screenshot_path", None) is not None:
+        if args.screenshot is not None:
+            parser.error("give the screenshot either as an argument or with --screenshot")
+        args.screenshot = args.screenshot_path
+    if getattr(args, "video", False) and args.screenshot is not None:
+        parser.error("--video reads the device screen, it cannot be used with a screenshot")
+
+    if args.trace is not None:
+        instrumentation.enable()
+    try:
+        args.run(args)
+    finally:
+        if args.trace is not None:
+            instrumentation.export_chrome_trace(args.trace)
+            print(f"Trace written to {args.trace}: {instrumentation.counters()}")
+
+
+if __name__ == "__main__":
+    main()
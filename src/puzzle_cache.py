@@ -0,0 +1,200 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+
+class PuzzleCache:
+    """
+    Persistent cache of boards already seen, in an sqlite database.
+
+    Boards are keyed by a perceptual hash of their clue panels, which maps straight to the clues read
+    from them, so a known board needs no OCR. Solutions are keyed by the clues themselves, so a board
+    read again (e.g. from another phone) needs no solving. At most max_entries puzzles are kept, the
+    least recently used ones are evicted first, together with the boards pointing at them.
+
+    Single digit glyphs read by Tesseract are kept too, keyed by a hash of their binarized bitmap, see
+    DigitRecognizer.glyph_key. Glyphs are shared by all boards of a device, so a few dozen cover every clue.
+
+    Example:
+    >>> with PuzzleCache() as cache:
+    >>>   solution = cache.lookup_solution(rows, cols)
+    >>>   if solution is None:
+    >>>     cache.store(rows, cols, Solver().solve_clues(rows, cols))
+    """
+
+    # clue panels are compared at half resolution, where digits still differ but noise is averaged out
+    HASH_SCALE = 0.5
+
+    def __init__(self, path: Path | None = None, max_entries=1000):
+        if path is None:
+            path = Path(__file__).parent.parent / "temp" / "puzzles.sqlite"
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.max_entries = max_entries
+        self.lock = threading.Lock()  # glyphs are looked up from the OCR threads
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript(
+            """
+            PRAGMA foreign_keys = ON;
+            CREATE TABLE IF NOT EXISTS puzzles (
+                clues_key TEXT PRIMARY KEY,
+                rows TEXT NOT NULL,
+                cols TEXT NOT NULL,
+                solution TEXT,
+                last_used REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS boards (
+                board_key TEXT PRIMARY KEY,
+                clues_key TEXT NOT NULL REFERENCES puzzles (clues_key) ON DELETE CASCADE
+            );
+            CREATE INDEX IF NOT EXISTS puzzles_last_used ON puzzles (last_used);
+            CREATE INDEX IF NOT EXISTS boards_clues_key ON boards (clues_key);
+            CREATE TABLE IF NOT EXISTS glyphs (
+                glyph_key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS glyphs_last_used ON glyphs (last_used);
+            """
+        )
+
+    @classmethod
+    def board_key(cls, left: np.ndarray, top: np.ndarray) -> str:
+        """Perceptual hash of the row (LEFT) and column (TOP) clue panels.
+
+        Each panel is scaled down with area averaging and binarized, so compression noise and slight color
+        differences between captures do not change the key, then the bits are hashed together with the panel sizes.
+        """
+        digest = hashlib.sha256()
+        for panel in (left, top):
+            gray = cv2.cvtColor(panel, cv2.COLOR_BGR2GRAY) if panel.ndim == 3 else panel
+            small = cv2.resize(gray, None, fx=cls.HASH_SCALE, fy=cls.HASH_SCALE, interpolation=cv2.INTER_AREA)
+            digest.update(np.array(small.shape, dtype=np.int32).tobytes())
+            digest.update(np.packbits(small > 127).tobytes())
+        return digest.hexdigest()
+
+    @staticmethod
+    def clues_key(rows: list[list[int]], cols: list[list[int]]) -> str:
+        """Hash of the normalized clues: zero clues dropped, so that [0] and [] are the same."""
+        normalized = ([[n for n in row if n > 0] for row in rows], [[n for n in col if n > 0] for col in cols])
+        return hashlib.sha256(json.dumps(normalized, separators=(",", ":")).encode()).hexdigest()
+
+    def __touch(self, clues_key: str):
+        self.connection.execute("UPDATE puzzles SET last_used = ? WHERE clues_key = ?", (time.time(), clues_key))
+        self.connection.commit()
+
+    def lookup_board(self, board_key: str) -> tuple[list[list[int]], list[list[int]]] | None:
+        """Clues of a board seen before, or None."""
+        row = self.connection.execute(
+            "SELECT puzzles.clues_key, rows, cols FROM boards JOIN puzzles USING (clues_key) WHERE board_key = ?",
+            (board_key,),
+        ).fetchone()
+        if row is None:
+            return None
+
+        clues_key, rows, cols = row
+        self.__touch(clues_key)
+        return json.loads(rows), json.loads(cols)
+
+    def lookup_solution(self, rows: list[list[int]], cols: list[list[int]]) -> np.ndarray | None:
+        """Stored solution of a puzzle as a (rows, cols) boolean array, or None."""
+        clues_key = self.clues_key(rows, cols)
+        row = self.connection.execute(
+            "SELECT solution FROM puzzles WHERE clues_key = ? AND solution IS NOT NULL", (clues_key,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        self.__touch(clues_key)
+        return np.array([[char == "#" for char in line] for line in row[0].split("\n")], dtype=bool)
+
+    def store(
+        self,
+        rows: list[list[int]],
+        cols: list[list[int]],
+        solution: np.ndarray | None = None,
+        board_key: str | None = None,
+    ):
+        """Remember the clues of a puzzle, its solution if given and the board it was read from if given."""
+        clues_key = self.clues_key(rows, cols)
+        text = None if solution is None else "\n".join("".join("#" if cell else "." for cell in row) for row in solution)
+
+        with self.connection:
+            self.connection.execute(
+                """
+                INSERT INTO puzzles (clues_key, rows, cols, solution, last_used) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (clues_key) DO UPDATE SET
+                    solution = COALESCE(excluded.solution, solution), last_used = excluded.last_used
+                """,
+                (clues_key, json.dumps(rows), json.dumps(cols), text, time.time()),
+            )
+            if board_key is not None:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO boards (board_key, clues_key) VALUES (?, ?)", (board_key, clues_key)
+                )
+
+            # evict the least recently used puzzles over the bound, their boards go with them
+            self.connection.execute(
+                """
+                DELETE FROM puzzles WHERE clues_key IN (
+                    SELECT clues_key FROM puzzles ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+
+    def lookup_glyphs(self, glyph_keys: list[str]) -> dict[str, int]:
+        """Stored values of the known glyphs among glyph_keys."""
+        if not glyph_keys:
+            return {}
+
+        unique = list(set(glyph_keys))
+        with self.lock, self.connection:
+            known = {}
+            # stay below sqlite's limit on the number of query parameters
+            for start in range(0, len(unique), 500):
+                part = unique[start : start + 500]
+                placeholders = ",".join("?" * len(part))
+                known.update(
+                    self.connection.execute(
+                        f"SELECT glyph_key, value FROM glyphs WHERE glyph_key IN ({placeholders})", part
+                    ).fetchall()
+                )
+            self.connection.executemany(
+                "UPDATE glyphs SET last_used = ? WHERE glyph_key = ?", [(time.time(), key) for key in known]
+            )
+        return known
+
+    def store_glyphs(self, values: dict[str, int]):
+        """Remember the values of glyphs. At most max_entries glyphs are kept, the least recently used are evicted."""
+        if not values:
+            return
+
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO glyphs (glyph_key, value, last_used) VALUES (?, ?, ?)",
+                [(key, value, now) for key, value in values.items()],
+            )
+            self.connection.execute(
+                "DELETE FROM glyphs WHERE glyph_key IN (SELECT glyph_key FROM glyphs ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM puzzles").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
@@ -1,33 +1,458 @@
+import heapq
+import itertools
+from functools import lru_cache
 from pathlib import Path
-import subprocess
+from typing import Iterator
+
+import numpy as np
+
+from instrumentation import count, span, traced
+
+
+Candidates = list[tuple[int, float]]  # (value, confidence) alternatives of one clue number, most likely first
+LineCandidates = list[list[Candidates]]  # alternative splits of the digits of a line into clue numbers
+
+
+class Contradiction(Exception):
+    """Raised when a line has no placement consistent with its clue and known cells."""
+
+
+class AmbiguousClues(Exception):
+    """Raised when uncertain clues can be read as more than one solvable puzzle."""
+
+    def __init__(self, puzzles: list[tuple[list[list[int]], list[list[int]]]], message: str | None = None):
+        super().__init__(message or f"{len(puzzles)} readings of the clues are solvable")
+        self.puzzles = puzzles  # (rows, cols) of the solvable readings found
+
+
+def solve_line(clue: tuple[int, ...], length: int, filled: int, empty: int) -> tuple[int, int]:
+    """Run line logic on a single row or column.
+
+    Cells are packed into ints, bit i being cell i of the line. `filled` and `empty`
+    hold the cells known so far. Every placement of the clue consistent with them is
+    enumerated through a forward/backward reachability pass, and the cells that are
+    filled (or empty) in all of them are returned as the new (filled, empty) masks.
+
+    Raises:
+        Contradiction: no placement fits the known cells.
+    """
+    k = len(clue)
+    full = (1 << length) - 1
+    block_masks = [(1 << size) - 1 for size in clue]
+
+    def fits(j: int, i: int) -> bool:
+        # block j placed at cell i: no known empty cell under it, no known filled cell right after it
+        size = clue[j]
+        if i + size > length:
+            return False
+        if (empty >> i) & block_masks[j]:
+            return False
+        return i + size == length or not (filled >> (i + size)) & 1
+
+    # state (j, i): j blocks placed, cells before i decided
+    # forward[j][i]: state reachable from the start of the line
+    forward = [[False] * (length + 1) for _ in range(k + 1)]
+    forward[0][0] = True
+    for j in range(k + 1):
+        row = forward[j]
+        for i in range(length + 1):
+            if not row[i]:
+                continue
+            if i < length and not (filled >> i) & 1:
+                row[i + 1] = True
+            if j < k and fits(j, i):
+                forward[j + 1][min(i + clue[j] + 1, length)] = True
+
+    if not forward[k][length]:
+        raise Contradiction(clue)
+
+    # backward[j][i]: the end of the line is reachable from state (j, i)
+    backward = [[False] * (length + 1) for _ in range(k + 1)]
+    backward[k][length] = True
+    can_fill = 0
+    can_empty = 0
+    for j in range(k, -1, -1):
+        row = backward[j]
+        for i in range(length, -1, -1):
+            if i < length and not (filled >> i) & 1 and row[i + 1]:
+                row[i] = True
+                if forward[j][i]:
+                    can_empty |= 1 << i
+            if j < k and fits(j, i):
+                end = i + clue[j]
+                if backward[j + 1][min(end + 1, length)]:
+                    row[i] = True
+                    if forward[j][i]:
+                        can_fill |= block_masks[j] << i
+                        if end < length:
+                            can_empty |= 1 << end
+
+    return full & ~can_empty, full & ~can_fill
+
+
+def _solve_line_or_none(clue: tuple[int, ...], length: int, filled: int, empty: int) -> tuple[int, int] | None:
+    """solve_line returning None on contradiction, so that contradictions get cached too."""
+    try:
+        return solve_line(clue, length, filled, empty)
+    except Contradiction:
+        return None
+
 
 class Solver:
-    def __init__(self):
-        self.lib_path = Path(__file__).parent / "lib"
-        self.temp_path = self.lib_path / "temp"
-        self.temp_path.mkdir(exist_ok=True)
-
-        # Run solver
-        self.solver_path = self.lib_path / "picross-solver" / "bin" / "picross_solver_cli.exe"
-
-    def solve(self, problem_path, side):
-        solver_output = subprocess.check_output([self.solver_path, problem_path]).decode("utf-8")
-
-        # Read solution
-        solution_text = []
-        lines = solver_output.splitlines()
-        for i, line in enumerate(lines):
-            if "Solution nb 1" in line:
-                solution_text = lines[i + 1 : i + 1 + side]
-                break
-
-        solution = []
-        for y, line in enumerate(solution_text):
-            solution.append([])
-            for x, char in enumerate(line):
-                if char == "#":
-                    solution[len(solution) - 1].append(True)
+    """
+    In-process nonogram solver.
+
+    Rows and columns are bitmask-packed. Dirty lines are kept in a queue and re-run through
+    line logic until nothing changes; backtracking only starts when line logic stalls.
+
+    Line results are memoized in an LRU cache keyed by (clue, length, filled mask, empty mask).
+    The cache lives on the Solver instance, so reuse one Solver across boards to share it.
+
+    Example:
+    >>> solution = Solver().solve(problem_path)
+    """
+
+    def __init__(self, cache_size: int | None = 1 << 16):
+        """
+        cache_size: maximum number of cached line results, None for unbounded, 0 to disable
+        """
+        self.__solve_line = lru_cache(maxsize=cache_size)(_solve_line_or_none)
+
+    def cache_info(self):
+        """Hit/miss counts and size of the line cache."""
+        return self.__solve_line.cache_info()
+
+    def cache_clear(self):
+        self.__solve_line.cache_clear()
+
+    @staticmethod
+    def read_problem(problem_path: Path) -> tuple[list[list[int]], list[list[int]]]:
+        """Read a problem in the format written by BoardReader.print_to_file."""
+        with open(problem_path, "r") as f:
+            lines = [line.strip() for line in f]
+
+        height, width = (int(n) for n in lines[0].split())
+        separator = lines.index("#")
+        rows = [[int(n) for n in line.split()] for line in lines[1:separator]]
+        cols = [[int(n) for n in line.split()] for line in lines[separator + 1 : separator + 1 + width]]
+        if len(rows) != height or len(cols) != width:
+            raise Exception(f"Malformed problem file: {problem_path}")
+
+        return rows, cols
+
+    def solve(self, problem_path: Path, side: int | None = None) -> np.ndarray:
+        """Solve a .nin problem file. Returns the grid as a (rows, cols) boolean array."""
+        rows, cols = self.read_problem(problem_path)
+        if side is not None and (len(rows) != side or len(cols) != side):
+            raise Exception(f"Expected a {side}x{side} problem, got {len(rows)}x{len(cols)}")
+
+        return self.solve_clues(rows, cols)
+
+    @traced("solve")
+    def solve_clues(self, rows: list[list[int]], cols: list[list[int]]) -> np.ndarray:
+        """Solve a puzzle given its row and column clues. Returns a (rows, cols) boolean array."""
+        solution = np.zeros((len(rows), len(cols)), dtype=bool)
+        for kind, index, mask in self.iter_solve(rows, cols):
+            if kind == "row":
+                for x in range(len(cols)):
+                    solution[index, x] = (mask >> x) & 1
+        return solution
+
+    def iter_solve(self, rows: list[list[int]], cols: list[list[int]]) -> Iterator[tuple[str, int, int]]:
+        """Solve a puzzle, yielding lines as soon as they are fully determined.
+
+        Lines solved by line logic alone are yielded the moment propagation completes them, so that the caller
+        can act on them while the rest of the board is propagated and searched. Every row is yielded exactly
+        once, columns only if line logic completed them before the search.
+
+        Yields:
+            ("row" or "col", index, filled mask) for each completed line, bit i of the mask being cell i.
+        """
+        row_clues = [tuple(n for n in row if n > 0) for row in rows]
+        col_clues = [tuple(n for n in col if n > 0) for col in cols]
+        height, width = len(row_clues), len(col_clues)
+
+        if sum(map(sum, row_clues)) != sum(map(sum, col_clues)):
+            raise Exception("Row and column clue sums differ")
+
+        state = ([0] * height, [0] * height, [0] * width, [0] * width)
+        done_rows = set()
+        try:
+            # no span here, it would include the time the caller spends on each line
+            for kind, index, mask in self.__propagate_lines(row_clues, col_clues, state, range(height), range(width)):
+                if kind == "row":
+                    done_rows.add(index)
+                yield kind, index, mask
+        except Contradiction:
+            raise Exception("Puzzle has no solution")
+
+        if len(done_rows) == height:
+            return
+
+        with span("search"):
+            result = self.__search(row_clues, col_clues, state, [], [])
+        if result is None:
+            raise Exception("Puzzle has no solution")
+
+        yield from (("row", y, result[0][y]) for y in range(height) if y not in done_rows)
+
+    @traced("resolve_clues")
+    def resolve_clues(
+        self,
+        row_candidates: list[LineCandidates],
+        col_candidates: list[LineCandidates],
+        max_readings=1 << 16,
+        max_line_readings=32,
+    ) -> tuple[list[list[int]], list[list[int]]]:
+        """Pick the only solvable reading of clues with uncertain numbers.
+
+        Every combination of candidates of a split of a line is a reading of the line. Only the max_line_readings most likely readings
+        that fit the line length are kept, then whole-board readings whose row and column sums differ are dropped.
+        The rest are tried most likely first, until a second solvable one shows the clues are ambiguous.
+
+        Args:
+            row_candidates: splits of each row into clue number candidates, as read by BoardReader.run_candidates
+            max_readings: maximum number of whole-board readings to enumerate
+            max_line_readings: number of readings kept for each line
+
+        Raises:
+            AmbiguousClues: more than one reading is solvable, or there are too many to try
+        """
+        height, width = len(row_candidates), len(col_candidates)
+        lines = [(line, width) for line in row_candidates] + [(line, height) for line in col_candidates]
+
+        # readings of each line that fit its length, most likely first
+        line_readings = []
+        for index, (line, length) in enumerate(lines):
+            readings = self.__line_readings(line, length, max_line_readings)
+            if not readings:
+                kind, number = ("row", index) if index < height else ("column", index - height)
+                raise Exception(f"No reading of {kind} {number} fits the board")
+            line_readings.append(readings)
+
+        uncertain = [i for i, readings in enumerate(line_readings) if len(readings) > 1]
+        reading_count = int(np.prod([len(line_readings[i]) for i in uncertain]))
+        base = [readings[0][0] for readings in line_readings]
+        if reading_count == 1:
+            return base[:height], base[height:]
+        if reading_count > max_readings:
+            raise AmbiguousClues([], f"{reading_count} readings of the clues, too many to try")
+
+        options = []
+        for choice in itertools.product(*(line_readings[i] for i in uncertain)):
+            clues = list(base)
+            for i, (clue, _) in zip(uncertain, choice):
+                clues[i] = clue
+            if sum(map(sum, clues[:height])) == sum(map(sum, clues[height:])):
+                options.append((float(np.prod([confidence for _, confidence in choice])), clues))
+        options.sort(key=lambda option: -option[0])
+
+        solvable = []
+        for _, clues in options:
+            row_clues = [tuple(n for n in clue if n > 0) for clue in clues[:height]]
+            col_clues = [tuple(n for n in clue if n > 0) for clue in clues[height:]]
+            state = ([0] * height, [0] * height, [0] * width, [0] * width)
+            if self.__search(row_clues, col_clues, state) is not None:
+                solvable.append((clues[:height], clues[height:]))
+                if len(solvable) > 1:
+                    raise AmbiguousClues(solvable)
+
+        if not solvable:
+            raise Exception("Puzzle has no solution")
+        return solvable[0]
+
+    @staticmethod
+    def __line_readings(splits: LineCandidates, length: int, limit: int) -> list[tuple[list[int], float]]:
+        """The `limit` most likely readings of a line that fit its length, most likely first.
+
+        A depth-first search over the candidates of each number of each split, which drops a prefix as soon as its
+        numbers and gaps exceed the length, or once even its most likely completion cannot beat the limit-th reading.
+        A 0 reads as no number, see BoardReader.digits_to_numbers. The empty line reads as [0].
+        """
+        best: dict[tuple[int, ...], float] = {}
+        heap: list[tuple[float, tuple[int, ...]]] = []  # min-heap over best, entries of replaced readings are stale
+
+        def drop_stale():
+            while heap and best.get(heap[0][1]) != heap[0][0]:
+                heapq.heappop(heap)
+
+        def threshold() -> float:
+            if len(best) < limit:
+                return -1.0
+            drop_stale()
+            return heap[0][0]
+
+        clue: list[int] = []
+        visited = 0
+
+        def visit(line: list[Candidates], bound: list[float], i: int, used: int, confidence: float):
+            nonlocal visited
+            visited += 1
+            if confidence * bound[i] <= threshold():
+                return
+            if i == len(line):
+                key = tuple(clue)
+                if confidence > best.get(key, -1.0):
+                    best[key] = confidence
+                    heapq.heappush(heap, (confidence, key))
+                    if len(best) > limit:
+                        drop_stale()
+                        del best[heapq.heappop(heap)[1]]
+                return
+            for value, p in line[i]:
+                if value == 0:
+                    visit(line, bound, i + 1, used, confidence * p)
+                elif used + value + (1 if clue else 0) <= length:
+                    clue.append(value)
+                    visit(line, bound, i + 1, used + value + (1 if len(clue) > 1 else 0), confidence * p)
+                    clue.pop()
+
+        for line in splits:
+            # most likely confidence of the numbers from each one on
+            bound = [1.0] * (len(line) + 1)
+            for i in range(len(line) - 1, -1, -1):
+                bound[i] = bound[i + 1] * max((confidence for _, confidence in line[i]), default=0.0)
+            visit(line, bound, 0, 0, 1.0)
+        count("line_reading_nodes", visited)
+        return [(list(key) or [0], confidence) for key, confidence in sorted(best.items(), key=lambda item: -item[1])]
+
+    def __propagate(self, row_clues, col_clues, state, dirty_rows, dirty_cols):
+        """Run line logic until no line changes. Modifies state in place."""
+        for _ in self.__propagate_lines(row_clues, col_clues, state, dirty_rows, dirty_cols):
+            pass
+
+    def __propagate_lines(
+        self, row_clues, col_clues, state, dirty_rows, dirty_cols
+    ) -> Iterator[tuple[str, int, int]]:
+        """__propagate, yielding ("row" or "col", index, filled mask) of each line as soon as it is complete.
+
+        A line completed by its crossing lines is queued all the same, so it is yielded when it is processed.
+        """
+        row_filled, row_empty, col_filled, col_empty = state
+        height, width = len(row_clues), len(col_clues)
+        row_full, col_full = (1 << width) - 1, (1 << height) - 1
+
+        queue = [("row", y) for y in dirty_rows] + [("col", x) for x in dirty_cols]
+        queued = set(queue)
+        completed = set()
+        processed = 0
+        try:
+            while queue:
+                item = queue.pop()
+                queued.discard(item)
+                kind, index = item
+                processed += 1
+
+                if kind == "row":
+                    filled, empty = row_filled[index], row_empty[index]
+                    result = self.__solve_line(row_clues[index], width, filled, empty)
+                    if result is None:
+                        raise Contradiction(row_clues[index])
+                    new_filled, new_empty = result
+                    row_filled[index], row_empty[index] = new_filled, new_empty
+                    cross_filled, cross_empty, other = col_filled, col_empty, "col"
+                    is_complete = new_filled | new_empty == row_full
                 else:
-                    solution[len(solution) - 1].append(False)
+                    filled, empty = col_filled[index], col_empty[index]
+                    result = self.__solve_line(col_clues[index], height, filled, empty)
+                    if result is None:
+                        raise Contradiction(col_clues[index])
+                    new_filled, new_empty = result
+                    col_filled[index], col_empty[index] = new_filled, new_empty
+                    cross_filled, cross_empty, other = row_filled, row_empty, "row"
+                    is_complete = new_filled | new_empty == col_full
+
+                # push newly known cells into the crossing lines
+                bit = 1 << index
+                for changed, cross in ((new_filled & ~filled, cross_filled), (new_empty & ~empty, cross_empty)):
+                    while changed:
+                        low = changed & -changed
+                        other_index = low.bit_length() - 1
+                        cross[other_index] |= bit
+                        if (other, other_index) not in queued:
+                            queued.add((other, other_index))
+                            queue.append((other, other_index))
+                        changed ^= low
+
+                if is_complete and item not in completed:
+                    completed.add(item)
+                    yield kind, index, new_filled
+        finally:
+            count("solver_lines", processed)
+
+    @staticmethod
+    def __assign(state, y, x, is_filled):
+        """Copy of state with cell (x, y) set."""
+        guess = tuple(list(masks) for masks in state)
+        guess[0 if is_filled else 1][y] |= 1 << x
+        guess[2 if is_filled else 3][x] |= 1 << y
+        return guess
+
+    def __search(self, row_clues, col_clues, state, dirty_rows=None, dirty_cols=None):
+        height, width = len(row_clues), len(col_clues)
+        if dirty_rows is None:
+            dirty_rows, dirty_cols = range(height), range(width)
+
+        try:
+            self.__propagate(row_clues, col_clues, state, dirty_rows, dirty_cols)
+        except Contradiction:
+            return None
+
+        full = (1 << width) - 1
+        while True:
+            row_filled, row_empty = state[0], state[1]
+            unknown_cells = [
+                (y, x)
+                for y in range(height)
+                for x in range(width)
+                if not ((row_filled[y] | row_empty[y]) >> x) & 1
+            ]
+            if not unknown_cells:
+                return state
+
+            # line logic stalled: probe both values of every unknown cell.
+            # A value leading to a contradiction forces the other one.
+            known_before = sum((full & (f | e)).bit_count() for f, e in zip(row_filled, row_empty))
+            best_cell, best_gain = None, -1
+            forced = False
+            probes = 0
+            try:
+                for y, x in unknown_cells:
+                    if ((state[0][y] | state[1][y]) >> x) & 1:
+                        continue  # decided by an earlier probe in this round
+
+                    gains = []
+                    for is_filled in (True, False):
+                        probes += 1
+                        probe = self.__assign(state, y, x, is_filled)
+                        try:
+                            self.__propagate(row_clues, col_clues, probe, [y], [x])
+                        except Contradiction:
+                            state = self.__assign(state, y, x, not is_filled)
+                            try:
+                                self.__propagate(row_clues, col_clues, state, [y], [x])
+                            except Contradiction:
+                                return None
+                            forced = True
+                            break
+                        gains.append(
+                            sum((full & (f | e)).bit_count() for f, e in zip(probe[0], probe[1])) - known_before
+                        )
+
+                    if not forced and min(gains) > best_gain:
+                        best_cell, best_gain = (y, x), min(gains)
+            finally:
+                count("solver_probes", probes)
+
+            if forced:
+                continue
+
+            # nothing forced: branch on the cell whose probes taught the most
+            y, x = best_cell
+            for is_filled in (True, False):
+                result = self.__search(row_clues, col_clues, self.__assign(state, y, x, is_filled), [y], [x])
+                if result is not None:
+                    return result
+                count("solver_backtracks")
 
-        return solution
\ No newline at end of file
+            return None
@@ -1,162 +1,130 @@
-import socket
-import pathlib
-from time import sleep
-import subprocess
+import asyncio
 import threading
-import queue
+
+from async_touch_handler import AsyncTouchHandler
+from device_session import DeviceSession
+from frame_source import FrameSource
 
 
 class TouchHandler:
     """
-    TouchHandler sends touch events to the Android device. It uses the scrcpy server to do so.
-    Only one instance of TouchHandler can be used at a time. Only one connected device is supported.
+    TouchHandler sends touch events to the Android device. It uses the scrcpy server to do so,
+    through a DeviceSession. Only one instance of TouchHandler can be used at a time.
+
+    If a FrameSource is given, the scrcpy video stream is enabled too and handed to it.
+
+    This is a blocking wrapper around AsyncTouchHandler, whose event loop runs in a background thread.
+    Taps and strokes are buffered until flush(), then sent in bursts of burst_size steps, paced to
+    taps_per_second for taps and moves_per_second for the steps of a stroke. drain() waits until
+    everything added so far has been sent.
 
     Example:
     >>> with TouchHandler() as touch_handler:
     >>>   touch_handler.touch(100, 100)
     """
 
-    def __run_worker(self):
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.bind((self.host, self.port))
-            s.listen()
-            control_conn, _ = s.accept()
-            with control_conn:
-                while self.worker_running:
-                    try:
-                        (x, y) = self.touch_queue.get(True, 0.5)
-                        control_conn.send(self.__encode_touch_action_down(x, y))
-                        control_conn.send(self.__encode_touch_action_up(x, y))
-                        self.touch_queue.task_done()
-                    except queue.Empty:
-                        pass
-
-    def __init__(self, width=1080, height=2400, host="127.0.0.1", port=27183):
-        self.current_directory = str(pathlib.Path(__file__).parent.resolve()) + "/"
+    def __init__(
+        self,
+        width: int | None = None,
+        height: int | None = None,
+        host="127.0.0.1",
+        port=27183,
+        frame_source: FrameSource | None = None,
+        taps_per_second=20.0,
+        moves_per_second=60.0,
+        burst_size=1,
+        session: DeviceSession | None = None,
+    ):
+        """
+        width, height: screen size in pixels, read from the device with `wm size` by default
+        session: device session to send through, kept open on exit. By default a new session is
+            started on enter and closed on exit, using host, port and frame_source.
+        """
+        self.owns_session = session is None
+        self.session = session if session is not None else DeviceSession(host, port, frame_source)
 
         self.width = width
         self.height = height
-        self.host = host
-        self.port = port
 
-        self.touch_queue = queue.Queue()
+        self.taps_per_second = taps_per_second
+        self.moves_per_second = moves_per_second
+        self.burst_size = burst_size
+
+    def __call(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
 
     def __enter__(self):
-        subprocess.check_call(
-            [self.current_directory + "../lib/adb/adb.exe", "devices"]
+        self.session.start()
+        if self.width is None or self.height is None:
+            self.width, self.height = self.session.screen_size()
+
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.loop_thread.start()
+
+        self.handler = AsyncTouchHandler(
+            self.session.control_conn,
+            width=self.width,
+            height=self.height,
+            taps_per_second=self.taps_per_second,
+            moves_per_second=self.moves_per_second,
+            burst_size=self.burst_size,
         )
+        self.__call(self.handler.open())
 
-        subprocess.check_call(
-            [self.current_directory + "../lib/adb/adb.exe", "reverse", "--remove-all"]
-        )
-        subprocess.check_call(
-            [
-                self.current_directory + "../lib/adb/adb.exe",
-                "reverse",
-                "localabstract:scrcpy",
-                f"tcp:{self.port}",
-            ]
-        )
+        return self
 
-        subprocess.check_call(
-            [
-                self.current_directory + "../lib/adb/adb.exe",
-                "shell",
-                "rm",
-                "-rf",
-                "/data/local/tmp/scrcpy-server.jar",
-            ]
-        )
-        subprocess.check_call(
-            [
-                self.current_directory + "../lib/adb/adb.exe",
-                "push",
-                self.current_directory + "../lib/scrcpy/scrcpy-server",
-                "/data/local/tmp/scrcpy-server.jar",
-            ]
-        )
+    def __exit__(self, type, value, traceback):
+        try:
+            if type is None:
+                self.drain()
+        finally:
+            self.__call(self.handler.close())
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.loop_thread.join()
+            self.loop.close()
+            if self.owns_session:
+                self.session.close()
 
-        self.server_process = subprocess.Popen(
-            [
-                self.current_directory + "../lib/adb/adb.exe",
-                "shell",
-                "CLASSPATH=/data/local/tmp/scrcpy-server.jar",
-                "app_process",
-                "/",
-                "com.genymobile.scrcpy.Server",
-                "3.2",
-                "log_level=verbose",
-                "video=false",
-                "audio=false",
-                "control=true",
-                "stay_awake=true",
-                "power_off_on_close=false",
-                "clipboard_autosync=false",
-            ],
-            # stdout=subprocess.DEVNULL,
-        )
+    def add_touch(self, x, y):
+        """
+        Queue a touch event to be sent to the device. Full bursts are flushed to the sender automatically.
+        """
+        self.__call(self.handler.add_touch(x, y))
 
-        self.worker_running = True
-        worker_thread = threading.Thread(target=self.__run_worker)
-        worker_thread.start()
+    def add_stroke(self, points: list[tuple[int, int]]):
+        """
+        Queue a drag through the given points: down on the first one, a move to each following one, up on the last.
+        A single point is a tap.
+        """
+        self.__call(self.handler.add_stroke(points))
 
-        return self
+    def add_strokes(self, gestures: list[list[tuple[int, int]]]):
+        """
+        Queue several strokes at once.
+        """
+        self.__call(self.handler.add_strokes(gestures))
 
-    def __exit__(self, type, value, traceback):
-        self.touch_queue.join()
-        self.worker_running = False
-        sleep(1)  # wait for worker to finish
-        self.server_process.kill()
-        subprocess.call(
-            [
-                self.current_directory + "../lib/adb/adb.exe",
-                "shell",
-                "am",
-                "kill",
-                "com.genymobile.scrcpy.Server",
-            ]
-        )
+    def add_key(self, keycode: int):
+        """
+        Queue a key press, keycode being an Android AKEYCODE_* value.
+        """
+        self.__call(self.handler.add_key(keycode))
 
-    def add_touch(self, x, y):
+    def flush(self):
+        """
+        Hand all buffered taps and strokes to the sender.
+        """
+        self.__call(self.handler.flush())
+
+    def busy(self) -> bool:
+        """
+        Whether taps and strokes handed to the sender are still being sent.
+        """
+        return self.__call(self.handler.busy())
+
+    def drain(self):
+        """
+        Flush and wait until every tap and stroke added so far has been sent.
         """
-        Queue a touch event to be sent to the device.
-        """
-        self.touch_queue.put((x, y))
-
-    def __encode_touch_action_down(self, x, y):
-        control_message = bytearray()
-        control_message.append(0x02)  # SC_CONTROL_MSG_TYPE_INJECT_TOUCH_EVENT
-        control_message.append(0x00)  # AKEY_EVENT_ACTION_DOWN
-        control_message += bytearray(
-            (0xFF, 0xFF, 0xFF, 0xFF, 0xFF, 0xFF, 0xFF, 0xFE)
-        )  # pointer id
-        control_message += bytearray(x.to_bytes(4, byteorder="big"))  # x
-        control_message += bytearray(y.to_bytes(4, byteorder="big"))  # y
-        control_message += bytearray(self.width.to_bytes(2, byteorder="big"))  # width
-        control_message += bytearray(self.height.to_bytes(2, byteorder="big"))  # height
-        control_message += bytearray((0xFF, 0xFF))  # pressure
-        control_message += bytearray(
-            (0x00, 0x00, 0x00, 0x01)
-        )  # AMOTION_EVENT_BUTTON_PRIMARY (action button)
-        control_message += bytearray(
-            (0x00, 0x00, 0x00, 0x01)
-        )  # AMOTION_EVENT_BUTTON_PRIMARY (buttons)
-        return control_message
-
-    def __encode_touch_action_up(self, x, y):
-        control_message = bytearray()
-        control_message.append(0x02)  # SC_CONTROL_MSG_TYPE_INJECT_TOUCH_EVENT
-        control_message.append(0x01)  # AKEY_EVENT_ACTION_UP
-        control_message += bytearray(
-            (0xFF, 0xFF, 0xFF, 0xFF, 0xFF, 0xFF, 0xFF, 0xFE)
-        )  # pointer id
-        control_message += bytearray(x.to_bytes(4, byteorder="big"))  # x
-        control_message += bytearray(y.to_bytes(4, byteorder="big"))  # y
-        control_message += bytearray(self.width.to_bytes(2, byteorder="big"))  # width
-        control_message += bytearray(self.height.to_bytes(2, byteorder="big"))  # height
-        control_message += bytearray((0x00, 0x00))  # pressure
-        control_message += bytearray(
-            (0x00, 0x00, 0x00, 0x01)
-        )  # AMOTION_EVENT_BUTTON_PRIMARY
-        control_message += bytearray((0x00, 0x00, 0x00, 0x00))  # none
-        return control_message
+        self.__call(self.handler.drain())